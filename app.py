@@ -1,28 +1,56 @@
 import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from routers.roll_router import router as roll_router
+from fastapi.responses import JSONResponse, PlainTextResponse
+from routers.roll_router import router as roll_router, LOG_DIR, loop_monitor, pc_reaper, roll_stats
+from services.log_pipeline import start_writer
+from services.metrics import metrics
+from services.static_assets import StaticAssets
 from datetime import datetime
 
 # Setup logging
 logging.basicConfig(filename='app.log', level=logging.ERROR, format='%(asctime)s:%(levelname)s:%(message)s')
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    pc_reaper.start()
+    roll_stats.start()
+    yield
+    await roll_stats.stop()
+    pc_reaper.stop()
+    loop_monitor.stop()
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app = FastAPI(lifespan=lifespan)
+
+# Serves the output of `python -m services.asset_build` when present, plain files otherwise
+static_assets = StaticAssets(directory="static")
+app.mount("/static", static_assets, name="static")
 
 @app.get("/")
-def read_root():
-    return FileResponse('static/index.html')
+def read_root(request: Request):
+    return static_assets.index_response(request.headers)
+
+@app.get("/metrics")
+def get_metrics():
+    if not metrics.enabled:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Include the new dice router
 app.include_router(roll_router, prefix="/dice")
 
-# Function to log command history
+# Command history is written in batches by a background thread
+def format_command_history(entry: dict):
+    return f"{entry['time']} - IP: {entry['ip']} - Command: {entry['command']} - Args: {entry['args']}\n"
+
+command_history = start_writer(
+    os.path.join(LOG_DIR, 'command_history.txt'), formatter=format_command_history, rotate_seconds=24 * 60 * 60
+)
+
 def log_command_history(ip: str, command: str, args: list):
-    with open('logs/command_history.txt', 'a') as f:
-        f.write(f"{datetime.now()} - IP: {ip} - Command: {command} - Args: {args}\n")
+    command_history.enqueue({"time": datetime.now(), "ip": ip, "command": command, "args": args})
 
 @app.post("/dice/log_command")
 async def log_command(request: Request):
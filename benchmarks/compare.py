@@ -0,0 +1,49 @@
+"""对比两次基准测试结果：python -m benchmarks.compare old.json new.json [--threshold 0.1]"""
+import argparse
+import json
+import sys
+
+# Each compared number maps to (value, True if higher is better)
+def collect(results):
+    metrics = {}
+    for name, case in results.get("micro", {}).items():
+        metrics[f"micro/{name} best_us"] = (case["best_us"], False)
+    http = results.get("http")
+    if http:
+        metrics["http requests_per_second"] = (http["requests_per_second"], True)
+        metrics["http p95_ms"] = (http["latency"]["p95_ms"], False)
+        for command, summary in http["by_command"].items():
+            metrics[f"http/{command} p50_ms"] = (summary["p50_ms"], False)
+    ws = results.get("ws")
+    if ws:
+        metrics["ws deliveries_per_second"] = (ws["deliveries_per_second"], True)
+        metrics["ws delivery p95_ms"] = (ws["delivery_latency"]["p95_ms"], False)
+        metrics["ws last_client p95_ms"] = (ws["last_client_latency"]["p95_ms"], False)
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported as a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.old, encoding='utf-8') as file:
+        old = collect(json.load(file))
+    with open(args.new, encoding='utf-8') as file:
+        new = collect(json.load(file))
+
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        (before, higher_is_better), (after, _) = old[name], new[name]
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = 'REGRESSION' if worse > args.threshold else ''
+        regressions += bool(flag)
+        print(f"{name:<50} {before:>12.3f} -> {after:>12.3f} {change:>+8.1%} {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.stats import summarize
+
+# Mixed command distribution: (weight, payload). PCs 1 and 2 come from the seeded copy of ./pcstats.
+COMMAND_MIX = (
+    (30, {"command": "r", "a1": "3d6+2"}),
+    (5, {"command": "r", "a1": "2d100+1d20"}),
+    (10, {"command": "rm", "a1": "1"}),
+    (20, {"command": "rd", "a1": "1", "a2": "侦查"}),
+    (5, {"command": "rh", "a1": "1d100"}),
+    (8, {"command": "rav", "a1": "1", "a2": "力量", "a3": "2", "a4": "力量"}),
+    (4, {"command": "ravs", "a1": "50", "a2": "60"}),
+    (4, {"command": "sc", "a1": "2", "a2": "0", "a3": "1"}),
+    (4, {"command": "hp", "a1": "2", "a2": "+1"}),
+    (10, {"command": "st", "a1": "1", "a2": "san"}),
+)
+
+
+def build_workload(requests, seed):
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in COMMAND_MIX]
+    payloads = [payload for _, payload in COMMAND_MIX]
+    return rng.choices(payloads, weights=weights, k=requests)
+
+
+async def run_async(app, requests, concurrency, seed):
+    workload = build_workload(requests, seed)
+    latencies = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def send(payload):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/dice/roll", json={**payload, "room": "bench-http"})
+                latencies.setdefault(payload["command"], []).append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in workload))
+        elapsed = time.perf_counter() - started
+
+    every = [latency for values in latencies.values() for latency in values]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        "latency": summarize(every),
+        "by_command": {command: summarize(values) for command, values in sorted(latencies.items())}
+    }
+
+
+def run(app, requests=2000, concurrency=32, seed=0):
+    return asyncio.run(run_async(app, requests, concurrency, seed))
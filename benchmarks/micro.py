@@ -0,0 +1,54 @@
+import statistics
+import time
+
+from routers.roll_router import DiceTool, parse_stats
+
+SAMPLE_SHEET = (
+    ".st 力量70str70敏捷70dex70意志45pow45体质50con50外貌50app50教育50edu50体型55siz55智力70灵感70int70"
+    "san45san值45理智45理智值45幸运50运气50mp9魔法9hp10体力10侦查60聆听50图书馆使用70图书馆70说服40心理学55"
+)
+
+# (name, callable); PC 1 comes from the benchmark's seeded copy of ./pcstats
+CASES = (
+    ("roll_dice 3d6+2", lambda: DiceTool.roll_dice("3d6+2")),
+    ("roll_dice 10d100", lambda: DiceTool.roll_dice("10d100")),
+    ("roll_dice 5000d6 (histogram)", lambda: DiceTool.roll_dice("5000d6")),
+    ("advanced_roll_dice +2", lambda: DiceTool.advanced_roll_dice(2)),
+    ("advanced_roll_dice -1", lambda: DiceTool.advanced_roll_dice(-1)),
+    ("rival_roll npc vs npc", lambda: DiceTool.rival_roll(False, "50", "60")),
+    ("rival_roll pc vs pc", lambda: DiceTool.rival_roll(True, "1", "力量", "1", "敏捷")),
+    ("calculate_success_level", lambda: DiceTool.calculate_success_level(50, 37)),
+    ("parse_stats", lambda: parse_stats(SAMPLE_SHEET)),
+)
+
+
+def measure(func, min_time=0.2, repeat=5):
+    # Calibrate the loop count so one repeat takes at least min_time
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {
+        "loops": number,
+        "repeat": repeat,
+        "best_us": min(timings) * 1e6,
+        "median_us": statistics.median(timings) * 1e6,
+        "ops_per_second": 1 / min(timings)
+    }
+
+
+def run(quick=False):
+    min_time, repeat = (0.05, 3) if quick else (0.2, 5)
+    return {name: measure(func, min_time, repeat) for name, func in CASES}
@@ -0,0 +1,101 @@
+"""离线基准测试：微基准、进程内HTTP压测与WebSocket广播延迟，结果写为JSON便于跨提交对比。
+
+    python -m benchmarks.run [--quick] [--only micro,http,ws] [--output path.json]
+    python -m benchmarks.compare old.json new.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ('micro', 'http', 'ws')
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def prepare_environment(workdir, seed):
+    # Seeded dice and a throwaway SQLite copy of ./pcstats keep runs repeatable and the tree untouched.
+    os.environ['DICE_RNG'] = f'seeded:{seed}'
+    os.environ['DICE_RNG_NONCE'] = seed
+    os.environ['DICE_PC_STORAGE'] = f"sqlite:{os.path.join(workdir, 'pcstats.db')}"
+    os.environ['DICE_ROLL_STATS_PATH'] = os.path.join(workdir, 'roll_stats.json')
+    os.environ['DICE_LOG_DIR'] = os.path.join(workdir, 'logs')
+    os.environ.setdefault('DICE_BROADCAST_BUS', 'memory')
+
+    from routers import roll_router
+    roll_router.pc_storage.import_directory('./pcstats')
+
+    import app
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', default=','.join(SCENARIOS), help='comma-separated: micro,http,ws')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads for a fast sanity run')
+    parser.add_argument('--seed', default='bench')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--broadcasts', type=int, default=200)
+    parser.add_argument('--output', help='defaults to benchmarks/results/<revision>-<timestamp>.json')
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.quick:
+        args.requests, args.clients, args.broadcasts = min(args.requests, 300), min(args.clients, 20), min(args.broadcasts, 30)
+
+    revision = git_revision()
+    results = {
+        "meta": {
+            "revision": revision,
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args)
+        }
+    }
+
+    with tempfile.TemporaryDirectory(prefix='dice-bench-') as workdir:
+        app_module = prepare_environment(workdir, args.seed)
+        asgi_app = app_module.app
+
+        if 'micro' in selected:
+            from benchmarks import micro
+            results["micro"] = micro.run(quick=args.quick)
+        if 'http' in selected:
+            from benchmarks import http_load
+            results["http"] = http_load.run(asgi_app, args.requests, args.concurrency, seed=args.seed)
+        if 'ws' in selected:
+            from benchmarks import ws_fanout
+            results["ws"] = ws_fanout.run(asgi_app, args.clients, args.broadcasts)
+
+        # Flush the log writers while their directory still exists
+        app_module.command_history.close()
+        logging.shutdown()
+
+    output = args.output or os.path.join('benchmarks', 'results', f"{revision}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"Wrote {output}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.stats import summarize
+
+
+class ASGIWebSocket:
+    """直接驱动ASGI应用的最小WebSocket客户端，与被测应用共用一个事件循环。"""
+
+    def __init__(self, app, path, query_string=b"", client_id=0):
+        self.app = app
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query_string,
+            "headers": [(b"host", b"bench")],
+            "client": ("bench", client_id),
+            "server": ("bench", 80),
+            "subprotocols": []
+        }
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue()
+        self._task = None
+
+    async def connect(self):
+        await self._to_app.put({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._from_app.put))
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"WebSocket rejected: {message}")
+
+    async def receive_text(self):
+        message = await self._from_app.get()
+        if message["type"] != "websocket.send":
+            raise RuntimeError(f"WebSocket closed: {message}")
+        return message.get("text") or message["bytes"].decode("utf-8")
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            await asyncio.wait_for(self._task, 5)
+
+
+def _markers(text):
+    # Coalesced broadcasts arrive as one bundle frame
+    frame = json.loads(text)
+    events = frame["events"] if frame.get("type") == "bundle" else [frame]
+    return [event.get("ip") for event in events]
+
+
+async def run_async(app, clients, broadcasts, interval, room):
+    sockets = [ASGIWebSocket(app, "/dice/ws", f"room={room}".encode(), index) for index in range(clients)]
+    for socket in sockets:
+        await socket.connect()
+
+    sent_at = {}
+    latencies = []
+    last_arrival = {}
+
+    async def listen(socket):
+        remaining = broadcasts
+        while remaining:
+            text = await socket.receive_text()
+            arrived = time.perf_counter()
+            for marker in _markers(text):
+                if marker in sent_at:
+                    latencies.append(arrived - sent_at[marker])
+                    last_arrival[marker] = max(last_arrival.get(marker, 0.0), arrived)
+                    remaining -= 1
+
+    listeners = [asyncio.create_task(listen(socket)) for socket in sockets]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for index in range(broadcasts):
+            marker = f"bench-{index}"
+            sent_at[marker] = time.perf_counter()
+            response = await client.post("/dice/roll", json={"command": "r", "a1": "1d100", "room": room, "ip": marker})
+            response.raise_for_status()
+            if interval:
+                await asyncio.sleep(interval)
+        await asyncio.wait_for(asyncio.gather(*listeners), 60)
+        elapsed = time.perf_counter() - started
+
+    for socket in sockets:
+        await socket.close()
+
+    return {
+        "clients": clients,
+        "broadcasts": broadcasts,
+        "interval_seconds": interval,
+        "deliveries": len(latencies),
+        "elapsed_seconds": elapsed,
+        "deliveries_per_second": len(latencies) / elapsed,
+        "delivery_latency": summarize(latencies),
+        "last_client_latency": summarize([last_arrival[marker] - sent_at[marker] for marker in last_arrival])
+    }
+
+
+def run(app, clients=100, broadcasts=200, interval=0.002, room="bench-ws"):
+    return asyncio.run(run_async(app, clients, broadcasts, interval, room))
@@ -1,14 +1,36 @@
-import json
+import asyncio
 import os
 import re
 import time
-import random
 import logging
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
-
-logging.basicConfig(filename='./logs/dice_tool.log', level=logging.ERROR, format='%(asctime)s:%(levelname)s:%(message)s', encoding='utf-8')
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import takewhile
+from typing import Callable, Optional, List, NamedTuple, Tuple
+from services.broadcast_bus import create_bus
+from services.connection_manager import ConnectionManager, normalize_room
+from services.dice_math import (
+    MAX_DISTRIBUTION_DICE, MAX_DISTRIBUTION_SUPPORT, SUCCESS_LEVELS, CRITICAL, REGULAR, FAILURE, d100_modifier_pmf, first_wins, plan_pmf,
+    plan_support, rival_win_probability, success_probabilities, success_probability_table, success_rank, summarize_pmf
+)
+from services.dice_rng import create_rng
+from services.event_history import EventHistory
+from services.log_pipeline import configure_logging
+from services.loop_monitor import EventLoopLagMonitor
+from services.metrics import metrics
+from services.pc_schema import TRACKED_ATTRIBUTES, canonical_name
+from services.pc_store import STORAGE_SECONDS, ExpiryReaper, PCStatCache, create_backend, run_blocking
+from services.roll_stats import RollStatistics
+from services.serialization import dumps, loads, with_events
+from services.sheet_transfer import SheetImport, export_csv, export_ndjson, iter_lines
+
+# DICE_LOG_DIR moves the error log and command history, e.g. into a benchmark's scratch directory
+LOG_DIR = os.environ.get('DICE_LOG_DIR', './logs')
+configure_logging(os.path.join(LOG_DIR, 'dice_tool.log'), level=logging.ERROR, fmt='%(asctime)s:%(levelname)s:%(message)s')
 
 class DiceToolError(Exception):
     pass
@@ -28,66 +50,251 @@ class PCFileNotFoundError(DiceToolError):
 class InvalidParameterError(Exception):
     pass
 
+MODIFIER_ERROR = '不合法的修正数值，修正数值为奖励骰的数量减去惩罚骰的数量。'
+
+VALID_DICE_TYPES = {2, 3, 4, 6, 8, 10, 20, 100}
+DICE_EXPRESSION_PATTERN = re.compile(r'^(\d*d\d+|\d+)([+-](\d*d\d+|\d+))*$')
+DICE_TERM_PATTERN = re.compile(r'([+-]?)(?:(\d*)d(\d+)|(\d+))')
+
+# Above LARGE_ROLL_THRESHOLD dice a roll is summarized instead of listing every die.
+LARGE_ROLL_THRESHOLD = int(os.environ.get('DICE_LARGE_ROLL_THRESHOLD', 100))
+LARGE_ROLL_CHUNK_SIZE = 65536
+MAX_DICE_PER_REQUEST = int(os.environ.get('DICE_MAX_DICE_PER_REQUEST', 1000000))
+MAX_TERMS_PER_REQUEST = int(os.environ.get('DICE_MAX_TERMS_PER_REQUEST', 20))
+
+class DicePlan(NamedTuple):
+    terms: tuple  # (sign, count, sides) in input order; sides == 0 marks a constant term
+    constant: int
+    dice_count: int
+
+@lru_cache(maxsize=1024)
+def _compile_normalized_dice_plan(expression):
+    if not DICE_EXPRESSION_PATTERN.match(expression):
+        raise InvalidDiceTypeError("输入指令无效，请点击“操作指引”获取帮助。")
+
+    matches = DICE_TERM_PATTERN.findall(expression)
+    if len(matches) > MAX_TERMS_PER_REQUEST:
+        raise InvalidDiceTypeError(f"表达式过长，单次最多{MAX_TERMS_PER_REQUEST}项。")
+
+    terms = []
+    constant = 0
+    dice_count = 0
+    for operator, num_dice, dice_type, static in matches:
+        sign = -1 if operator == '-' else 1
+        if static:
+            terms.append((sign, int(static), 0))
+            constant += sign * int(static)
+        else:
+            dice_type = int(dice_type)
+            if dice_type not in VALID_DICE_TYPES:
+                raise InvalidDiceTypeError(f"不存在这样的骰子哦：d{dice_type}。在这个维度中只存在以下这些骰子：{VALID_DICE_TYPES}")
+            count = int(num_dice) if num_dice else 1
+            terms.append((sign, count, dice_type))
+            dice_count += count
+    if dice_count > MAX_DICE_PER_REQUEST:
+        raise InvalidDiceTypeError(f"骰子太多啦，单次最多掷{MAX_DICE_PER_REQUEST}颗骰子。")
+    return DicePlan(tuple(terms), constant, dice_count)
+
+def compile_dice_plan(command):
+    return _compile_normalized_dice_plan(command.strip().lower())
+
+# Dice draw from buffered generators; DICE_RNG=crypto or seeded:<seed> switches the source.
+# DICE_RNG_NONCE replays a seeded session whose nonce was read from /dice/rng_stats.
+dice_rng = create_rng(os.environ.get('DICE_RNG'), nonce=os.environ.get('DICE_RNG_NONCE'))
+
+def draw_dice(low, high, count, draws=None):
+    if draws is None:
+        draws = dice_rng.for_room(normalize_room(None))
+    return draws.take(low, high, count)
+
+# CPU-heavy dice work runs here, off the event loop and apart from the storage pool
+compute_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='dice-compute')
+
+async def run_compute(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(compute_executor, partial(func, *args, **kwargs))
+
+# A shared bus means several workers serve the same sheets. Only SQLite is safe for that;
+# per-worker sheet caches and text-file journals would overwrite each other's changes.
+BROADCAST_BUS = os.environ.get('DICE_BROADCAST_BUS')
+SHARED_WORKERS = BROADCAST_BUS not in (None, '', 'memory')
+PC_STORAGE = os.environ.get('DICE_PC_STORAGE')
+if SHARED_WORKERS and not (PC_STORAGE or '').startswith('sqlite:'):
+    raise ValueError("DICE_BROADCAST_BUS requires DICE_PC_STORAGE=sqlite:<path>; text sheets cannot be shared between workers")
+
+pc_storage = create_backend(PC_STORAGE, './pcstats')
+pc_stat_cache = PCStatCache(pc_storage, capacity=0 if SHARED_WORKERS else 1000)
+# Sheets untouched for 30 days are deleted by a background task, not on the upload path.
+pc_reaper = ExpiryReaper(pc_storage, 30 * 24 * 60 * 60, on_expire=pc_stat_cache.invalidate)
+
+# Typed results; being tuples they still serialize as the positional arrays the frontend reads.
+class RollResult(NamedTuple):
+    expression: str
+    total: int
+    rolls: object  # list of faces, or the histogram summary for large rolls
+
+class PercentileRollResult(NamedTuple):
+    expression: str
+    total: int
+    tens: List[str]
+
+class SkillRollResult(NamedTuple):
+    skill_name: str
+    skill_value: int
+    roll: int
+    success_rank: int
+
+class PCRivalResult(NamedTuple):
+    pc1: int
+    pc2: int
+    skill1_name: str
+    skill2_name: str
+    skill1: int
+    skill2: int
+    roll1: int
+    roll2: int
+    success_rank1: int
+    success_rank2: int
+    winner: object
+
+class NPCvsPCRivalResult(NamedTuple):
+    pc: int
+    skill_name: str
+    npc_skill: int
+    pc_skill: int
+    npc_roll: int
+    pc_roll: int
+    npc_success_rank: int
+    pc_success_rank: int
+    winner: object
+
+class NPCRivalResult(NamedTuple):
+    skill1: int
+    skill2: int
+    roll1: int
+    roll2: int
+    success_rank1: int
+    success_rank2: int
+    winner: str
+
+class SanCheckResult(NamedTuple):
+    success_loss: str
+    fail_loss: str
+    int_value: int
+    success_rank: int
+    roll: int
+    reduction: int
+    remaining_san: int
+
+class SanAdjustResult(NamedTuple):
+    adjustment: str
+    remaining_san: int
+
+class HPAdjustResult(NamedTuple):
+    adjustment: str
+    value: int
+    remaining_hp: int
+
+class StatResult(NamedTuple):
+    stat_name: str
+    stat_value: int
+
+def parse_int(token):
+    try:
+        return int(token)
+    except (TypeError, ValueError):
+        return None
+
 class DiceTool:
     mode = 1
 
     @staticmethod
-    def roll_dice(command):
-        valid_dice_types = {2, 3, 4, 6, 8, 10, 20, 100}
-        pattern = re.compile(r'^(\d*d\d+|\d+)([+-](\d*d\d+|\d+))*$', re.IGNORECASE)
+    def roll_dice(command, draws=None):
+        plan = compile_dice_plan(command)
+        total, detailed_results = DiceTool.evaluate_plan(plan, draws)
+        return RollResult(command, total, detailed_results)
+
+    @staticmethod
+    def roll_total(expression, draws=None):
+        # Used by sc/hp/rh, which only need the total and may carry a leading sign.
+        expression = expression.strip()
+        sign = -1 if expression.startswith('-') else 1
+        plan = compile_dice_plan(expression.lstrip('+-'))
+        total = plan.constant
+        for term_sign, count, sides in plan.terms:
+            if sides:
+                if count > LARGE_ROLL_THRESHOLD:
+                    histogram = DiceTool.roll_histogram(count, sides, draws)
+                    total += term_sign * sum(face * times for face, times in histogram.items())
+                else:
+                    total += term_sign * sum(draw_dice(1, sides, count, draws))
+        return sign * total
+
+    @staticmethod
+    def roll_histogram(count, sides, draws=None):
+        # Draw in fixed-size chunks so memory stays flat no matter how many dice are rolled.
+        histogram = Counter()
+        remaining = count
+        while remaining > 0:
+            chunk = min(remaining, LARGE_ROLL_CHUNK_SIZE)
+            histogram.update(draw_dice(1, sides, chunk, draws))
+            remaining -= chunk
+        return histogram
 
-        if not pattern.match(command):
-            raise InvalidDiceTypeError("输入指令无效，请点击“操作指引”获取帮助。")
+    @staticmethod
+    def summarize_plan(plan, draws=None):
+        total = plan.constant
+        breakdown = []
+        for sign, count, sides in plan.terms:
+            if not sides:
+                continue
+            histogram = DiceTool.roll_histogram(count, sides, draws)
+            term_sum = sum(face * times for face, times in histogram.items())
+            total += sign * term_sum
+            breakdown.append({
+                "dice": f"{'-' if sign < 0 else ''}{count}d{sides}",
+                "count": count,
+                "sum": term_sum,
+                "min": min(histogram) if histogram else 0,
+                "max": max(histogram) if histogram else 0,
+                "histogram": {face: histogram[face] for face in sorted(histogram)}
+            })
+        summary = {
+            "count": plan.dice_count,
+            "constant": plan.constant,
+            "terms": breakdown
+        }
+        return total, summary
 
-        parts = re.split(r'([+-])', command)
+    @staticmethod
+    def evaluate_plan(plan, draws=None):
+        if plan.dice_count > LARGE_ROLL_THRESHOLD:
+            return DiceTool.summarize_plan(plan, draws)
 
-        total = 0
+        total = plan.constant
         detailed_results = []
-        current_operator = '+'
-
-        for part in parts:
-            if part in '+-':
-                current_operator = part
+        for sign, count, sides in plan.terms:
+            if sides:
+                results = draw_dice(1, sides, count, draws)
+                total += sign * sum(results)
+                detailed_results.extend(results)
             else:
-                dice_match = re.match(r'(\d*)d(\d+)', part, re.IGNORECASE)
-                static_match = re.match(r'(\d+)', part)
-                if dice_match:
-                    num_dice = int(dice_match.group(1)) if dice_match.group(1) else 1
-                    dice_type = int(dice_match.group(2))
-                    if dice_type not in valid_dice_types:
-                        raise InvalidDiceTypeError(f"不存在这样的骰子哦：d{dice_type}。在这个维度中只存在以下这些骰子：{valid_dice_types}")
-                    results = [random.randint(1, dice_type) for _ in range(num_dice)]
-                    part_total = sum(results)
-                    if current_operator == '-':
-                        total -= part_total
-                    else:
-                        total += part_total
-                    detailed_results.extend(results)
-                elif static_match:
-                    value = int(static_match.group(1))
-                    if current_operator == '-':
-                        total -= value
-                        detailed_results.append(-value)
-                    else:
-                        total += value
-                        detailed_results.append(value)
-
-        return (command, total, detailed_results)
+                detailed_results.append(sign * count)
+        return total, detailed_results
 
     @staticmethod
-    def advanced_roll_dice(modifier):
+    def advanced_roll_dice(modifier, draws=None):
         try:
             modifier = int(modifier)
-        except ValueError:
-            raise InvalidModifierError('不合法的修正数值，修正数值为奖励骰的数量减去惩罚骰的数量')
+        except (TypeError, ValueError):
+            raise InvalidModifierError(MODIFIER_ERROR)
         
         if modifier > 10:
             modifier = 10
         elif modifier < -10:
             modifier = -10
 
-        unit = random.randint(0, 9)
-        tens_rolls = [random.randint(0, 9) for _ in range(1 + abs(modifier))]
+        unit, *tens_rolls = draw_dice(0, 9, 2 + abs(modifier), draws)
 
         if modifier > 0:
             tens = min(tens_rolls)
@@ -103,32 +310,35 @@ class DiceTool:
             if result == 0:
                 result = 100
 
-        return ("1d100", result, [f"{t}0 + {unit}" for t in tens_rolls])
+        return PercentileRollResult("1d100", result, [f"{t}0 + {unit}" for t in tens_rolls])
+
+    @staticmethod
+    def pc_skill_roll(pc_number, skill_name, modifier=0, draws=None):
+        skill_value, roll_result, rank = DiceTool.pc_skill_check(pc_number, skill_name, modifier, draws)
+        return SkillRollResult(skill_name, skill_value, roll_result, rank)
 
     @staticmethod
-    def pc_skill_roll(pc_number, skill_name, modifier=0):
+    def get_skill_value(pc_number, skill_name):
         filename = f"./pcstats/pc_file{pc_number}.txt"
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                skills = {}
-                for line in file:
-                    name, value = line.strip().split('|')
-                    skills[name.lower()] = int(value)
-            if skill_name.lower() not in skills:
+            # Aliases such as 力量/str/理智 resolve to the canonical attribute here
+            skill_value = pc_stat_cache.get(pc_number).get(skill_name)
+            if skill_value is None:
                 raise SkillNotFoundError(f"技能“{skill_name}”未找到。")
 
-            skill_value = skills[skill_name.lower()]
+            return skill_value
         except FileNotFoundError:
             raise PCFileNotFoundError(f"PC属性文件“{filename}”未找到。")
 
-        roll_result = DiceTool.advanced_roll_dice(modifier)[1]
-        success_level = DiceTool.calculate_success_level(skill_value, roll_result)
-
-        return (skill_name, skill_value, roll_result, success_level)
+    @staticmethod
+    def pc_skill_check(pc_number, skill_name, modifier=0, draws=None):
+        skill_value = DiceTool.get_skill_value(pc_number, skill_name)
+        roll_result = DiceTool.advanced_roll_dice(modifier, draws).total
+        return (skill_value, roll_result, success_rank(skill_value, roll_result))
 
     @staticmethod
-    def secret_roll(command):
-        dice_result = DiceTool.roll_dice(command)[1]
+    def secret_roll(command, draws=None):
+        dice_result = DiceTool.roll_total(command, draws)
 
         tens_digit = (dice_result // 10) % 10
         units_digit = dice_result % 10
@@ -136,7 +346,7 @@ class DiceTool:
         if dice_result == 100:
             tens_digit = 0
             units_digit = 0
-        random_digits = [random.randint(0, 9) for _ in range(12)]
+        random_digits = draw_dice(0, 9, 12, draws)
 
         random_digits[2] = tens_digit
         random_digits[4] = units_digit
@@ -146,110 +356,93 @@ class DiceTool:
         return secret_value
 
     @staticmethod
-    def rival_roll(strict_mode, *args):
-        rival_type = DiceTool.determine_rival_roll_type(args)
+    def rival_roll(strict_mode, *args, draws=None):
+        # Each token is parsed once; None marks a skill name
+        values = [parse_int(arg) for arg in args]
+        rival_type = DiceTool.determine_rival_roll_type(values)
         player1_id = 'NPC1'
         player2_id = 'NPC2'
         pc1_skill_level = 0
         pc2_skill_level = 0
         pc1_skill_roll = 0
         pc2_skill_roll = 0
-        pc1_success_level = ''
-        pc2_success_level = ''
+        pc1_rank = FAILURE
+        pc2_rank = FAILURE
         if rival_type == 1:
-            player1_id = int(args[0])
+            player1_id = values[0]
             skill1_name = args[1]
-            player2_id = int(args[2])
+            player2_id = values[2]
             skill2_name = args[3]
-            modifier1 = int(args[4]) if len(args) > 4 else 0
-            modifier2 = int(args[5]) if len(args) > 5 else 0
+            modifier1 = values[4] if len(args) > 4 else 0
+            modifier2 = values[5] if len(args) > 5 else 0
 
-            _, pc1_skill_level, pc1_skill_roll, pc1_success_level = DiceTool.pc_skill_roll(player1_id, skill1_name, modifier1)
-            _, pc2_skill_level, pc2_skill_roll, pc2_success_level = DiceTool.pc_skill_roll(player2_id, skill2_name, modifier2)
+            pc1_skill_level, pc1_skill_roll, pc1_rank = DiceTool.pc_skill_check(player1_id, skill1_name, modifier1, draws)
+            pc2_skill_level, pc2_skill_roll, pc2_rank = DiceTool.pc_skill_check(player2_id, skill2_name, modifier2, draws)
 
         elif rival_type == 2:
-            kp_skill = int(args[0]) if not args[2].isdigit() else int(args[2])
-            player2_id = int(args[1]) if not args[2].isdigit() else int(args[0])
-            skill2_name = args[2] if not args[2].isdigit() else args[1]
+            # Either "skill pc name [m1 m2]" or "pc name skill [m2 m1]"
+            npc_last = values[2] is not None
+            kp_skill = values[2] if npc_last else values[0]
+            player2_id = values[0] if npc_last else values[1]
+            skill2_name = args[1] if npc_last else args[2]
             if len(args) > 3:
-                modifier1 = int(args[3]) if not args[2].isdigit() else int(args[4])
-                modifier2 = int(args[4])  if not args[2].isdigit() else int(args[3])
+                modifier1 = values[4] if npc_last else values[3]
+                modifier2 = values[3] if npc_last else values[4]
             else:
                 modifier1 = 0
                 modifier2 = 0
 
-            _, pc1_skill_roll, _ = DiceTool.advanced_roll_dice(modifier1)
-            _, pc2_skill_level, pc2_skill_roll, pc2_success_level = DiceTool.pc_skill_roll(player2_id, skill2_name, modifier2)
+            _, pc1_skill_roll, _ = DiceTool.advanced_roll_dice(modifier1, draws)
+            pc2_skill_level, pc2_skill_roll, pc2_rank = DiceTool.pc_skill_check(player2_id, skill2_name, modifier2, draws)
 
             pc1_skill_level = kp_skill
-            pc1_success_level = DiceTool.calculate_success_level(pc1_skill_level, pc1_skill_roll)
+            pc1_rank = success_rank(pc1_skill_level, pc1_skill_roll)
 
         elif rival_type == 3:
-            kp_skill1 = int(args[0])
-            kp_skill2 = int(args[1])
-            modifier1 = int(args[2]) if len(args) > 2 else 0
-            modifier2 = int(args[3]) if len(args) > 3 else 0
+            kp_skill1 = values[0]
+            kp_skill2 = values[1]
+            modifier1 = values[2] if len(args) > 2 else 0
+            modifier2 = values[3] if len(args) > 3 else 0
 
-            _, pc1_skill_roll, _ = DiceTool.advanced_roll_dice(modifier1)
-            _, pc2_skill_roll, _ = DiceTool.advanced_roll_dice(modifier2)
+            _, pc1_skill_roll, _ = DiceTool.advanced_roll_dice(modifier1, draws)
+            _, pc2_skill_roll, _ = DiceTool.advanced_roll_dice(modifier2, draws)
 
             pc1_skill_level = kp_skill1
             pc2_skill_level = kp_skill2
             
-            pc1_success_level = DiceTool.calculate_success_level(pc1_skill_level, pc1_skill_roll)
-            pc2_success_level = DiceTool.calculate_success_level(pc2_skill_level, pc2_skill_roll)
+            pc1_rank = success_rank(pc1_skill_level, pc1_skill_roll)
+            pc2_rank = success_rank(pc2_skill_level, pc2_skill_roll)
 
         else:
             raise InvalidParameterError("未识别的对抗类型。")
-        
-        success_type = ['大成功', '极限成功', '困难成功', '成功', '失败', '大失败']
-        if strict_mode:
-            if success_type.index(pc1_success_level) < success_type.index(pc2_success_level):
-                winner = player1_id
-            else:
-                winner = player2_id
+
+        if first_wins(strict_mode, pc1_rank, pc1_skill_level, pc1_skill_roll, pc2_rank, pc2_skill_level, pc2_skill_roll):
+            winner = player1_id
         else:
-            if success_type.index(pc1_success_level) < success_type.index(pc2_success_level):
-                winner = player1_id
-            elif success_type.index(pc1_success_level) > success_type.index(pc2_success_level):
-                winner = player2_id
-            else:
-                if pc1_skill_level > pc2_skill_level:
-                    winner = player1_id
-                elif pc1_skill_level < pc2_skill_level:
-                    winner = player2_id
-                else:
-                    if pc1_skill_roll < pc2_skill_roll:
-                        winner = player1_id
-                    else:
-                        winner = player2_id
+            winner = player2_id
 
         if rival_type == 1:
-            return (player1_id, player2_id, skill1_name, skill2_name, pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_success_level, pc2_success_level, winner)
+            return PCRivalResult(player1_id, player2_id, skill1_name, skill2_name, pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_rank, pc2_rank, winner)
         elif rival_type == 2:
-            return (player2_id, skill2_name, pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_success_level, pc2_success_level, winner)
+            return NPCvsPCRivalResult(player2_id, skill2_name, pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_rank, pc2_rank, winner)
         elif rival_type == 3:
-            return (pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_success_level, pc2_success_level, winner)
+            return NPCRivalResult(pc1_skill_level, pc2_skill_level, pc1_skill_roll, pc2_skill_roll, pc1_rank, pc2_rank, winner)
         
     @staticmethod
-    def determine_rival_roll_type(args):
-        if len(args) < 2 or len(args) > 6:
+    def determine_rival_roll_type(values):
+        # values are the pre-parsed tokens: an int, or None for a skill name
+        if len(values) < 2 or len(values) > 6:
             raise InvalidParameterError("Invalid number of parameters for rival roll.")
 
-        def is_int(val):
-            try:
-                int(val)
-                return True
-            except ValueError:
-                return False
-    
-        if is_int(args[0]) and len(args) >= 4 and is_int(args[2]) and not is_int(args[1]) and not is_int(args[3]):
+        is_int = [value is not None for value in values]
+
+        if is_int[0] and len(values) >= 4 and is_int[2] and not is_int[1] and not is_int[3]:
             return 1
         
-        if is_int(args[0]) and is_int(args[1]) or (is_int(args[0]) and not is_int(args[1]) and is_int(args[2])):
-            if len(args) == 2 or len(args) == 4:
+        if is_int[0] and is_int[1] or (is_int[0] and not is_int[1] and len(values) > 2 and is_int[2]):
+            if len(values) == 2 or len(values) == 4:
                 return 3
-            elif len(args) == 3 or len(args) == 5:
+            elif len(values) == 3 or len(values) == 5:
                 return 2
             else:
                 raise InvalidParameterError("Invalid parameters for Type 2 or 3 rival roll.")
@@ -257,140 +450,101 @@ class DiceTool:
         raise InvalidParameterError("Could not determine the type of rival roll.")
     
     @staticmethod
-    def sancheck(pc_number, success_san_loss, fail_san_loss=None):
-        filename = f"./pcstats/pc_file{pc_number}.txt"
-        try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                stats = {}
-                for line in file:
-                    name, value = line.strip().split('|')
-                    stats[name.lower()] = int(value)
+    def sancheck(pc_number, success_san_loss, fail_san_loss=None, draws=None):
+        # Serialize read-modify-write per PC now that commands run on storage threads
+        with pc_stat_cache.lock_for(pc_number):
+            try:
+                stats = pc_stat_cache.get(pc_number).copy()
 
-            if 'int' not in stats and fail_san_loss is not None:
-                raise SkillNotFoundError("INT属性未找到。")
+                if 'int' not in stats and fail_san_loss is not None:
+                    raise SkillNotFoundError("INT属性未找到。")
 
-            int_value = stats.get('int', None)
-        except FileNotFoundError:
-            return
-        if fail_san_loss is None:
-            try:
-                adjustment = int(success_san_loss)
-            except ValueError:
+                int_value = stats.get('int', None)
+            except FileNotFoundError:
                 return
-            stats['current_san'] = min(stats.get('current_san', stats.get('san', 0)) + adjustment, stats.get('san', 0))
-            remaining_san = stats['current_san']
-            if remaining_san < 0:
-                remaining_san = 0
-                stats['current_san'] = 0
+            if fail_san_loss is None:
+                try:
+                    adjustment = int(success_san_loss)
+                except ValueError:
+                    return
+                stats['current_san'] = min(stats.get('current_san', stats.get('san', 0)) + adjustment, stats.get('san', 0))
+                remaining_san = stats['current_san']
+                if remaining_san < 0:
+                    remaining_san = 0
+                    stats['current_san'] = 0
 
-            with open(filename, 'w', encoding='utf-8') as file:
-                for key, value in stats.items():
-                    file.write(f"{key}|{value}\n")
+                DiceTool.save_current_values(pc_number, {'current_san': stats['current_san']})
 
-            return (success_san_loss, remaining_san)
-        else:
-            skill_name = 'int'
-            roll_result, _, _, success_level = DiceTool.pc_skill_roll(pc_number, skill_name, 0)
+                return SanAdjustResult(success_san_loss, remaining_san)
+            else:
+                check = DiceTool.pc_skill_roll(pc_number, 'int', 0, draws)
+                roll_result, rank = check.roll, check.success_rank
+
+                def parse_san_loss(san_loss):
+                    return DiceTool.roll_total(san_loss, draws)
 
-            def parse_san_loss(san_loss):
-                if 'd' in san_loss:
-                    return DiceTool.roll_dice(san_loss)[1]
+                if rank == CRITICAL:
+                    reduction = min([parse_san_loss(val.strip()) for val in success_san_loss.split('+')])
+                elif rank <= REGULAR:
+                    reduction = parse_san_loss(success_san_loss)
                 else:
-                    return int(san_loss)
+                    reduction = parse_san_loss(fail_san_loss)
 
-            if success_level == "大成功":
-                reduction = min([parse_san_loss(val.strip()) for val in success_san_loss.split('+')])
-            elif success_level in ["极限成功", "困难成功", "成功"]:
-                reduction = parse_san_loss(success_san_loss)
-            else:
-                reduction = parse_san_loss(fail_san_loss)
+                remaining_san = stats.get('current_san', stats.get('san', 0)) - reduction
+                if remaining_san < 0:
+                    remaining_san = 0
 
-            remaining_san = stats.get('current_san', stats.get('san', 0)) - reduction
-            if remaining_san < 0:
-                remaining_san = 0
+                stats['current_san'] = remaining_san
 
-            stats['current_san'] = remaining_san
+                DiceTool.save_current_values(pc_number, {'current_san': stats['current_san']})
 
-            with open(filename, 'w', encoding='utf-8') as file:
-                for key, value in stats.items():
-                    file.write(f"{key}|{value}\n")
+                return SanCheckResult(success_san_loss, fail_san_loss, int_value, rank, roll_result, reduction, remaining_san)
 
-            return (success_san_loss, fail_san_loss, int_value, success_level, roll_result, reduction, remaining_san)
-        
     @staticmethod
-    def hp_adjust(pc_number, adjustment):
-        filename = f"./pcstats/pc_file{pc_number}.txt"
-        try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                stats = {}
-                for line in file:
-                    name, value = line.strip().split('|')
-                    stats[name.lower()] = int(value)
+    def hp_adjust(pc_number, adjustment, draws=None):
+        # Serialize read-modify-write per PC now that commands run on storage threads
+        with pc_stat_cache.lock_for(pc_number):
+            try:
+                stats = pc_stat_cache.get(pc_number).copy()
 
-            if 'hp' not in stats:
-                raise SkillNotFoundError("HP属性未找到。")
+                if 'hp' not in stats:
+                    raise SkillNotFoundError("HP属性未找到。")
 
-        except FileNotFoundError:
-            return
+            except FileNotFoundError:
+                return
 
-        def parse_adjustment(adj):
-            if 'd' in adj:
-                sign = -1 if adj.startswith('-') else 1
-                adj = adj.lstrip('+-')
-                return sign * DiceTool.roll_dice(adj)[1]
-            else:
-                return int(adj)
+            def parse_adjustment(adj):
+                return DiceTool.roll_total(adj, draws)
 
-        adjustment_value = parse_adjustment(adjustment)
-        stats['current_hp'] = min(max(stats.get('current_hp', stats.get('hp', 0)) + adjustment_value, 0), stats.get('hp', 0))
-        remaining_hp = stats['current_hp']
+            adjustment_value = parse_adjustment(adjustment)
+            stats['current_hp'] = min(max(stats.get('current_hp', stats.get('hp', 0)) + adjustment_value, 0), stats.get('hp', 0))
+            remaining_hp = stats['current_hp']
 
-        with open(filename, 'w', encoding='utf-8') as file:
-            for key, value in stats.items():
-                file.write(f"{key}|{value}\n")
+            DiceTool.save_current_values(pc_number, {'current_hp': stats['current_hp']})
+
+            return HPAdjustResult(adjustment, adjustment_value, remaining_hp)
+
+    @staticmethod
+    def save_current_values(pc_number, values):
+        pc_stat_cache.apply(pc_number, values)
+        pc_reaper.touch(pc_number)
 
-        return (adjustment, adjustment_value, remaining_hp)
-    
     @staticmethod
     def get_stat(pc_number, stat_name):
-        filename = f"./pcstats/pc_file{pc_number}.txt"
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                stats = {}
-                for line in file:
-                    name, value = line.strip().split('|')
-                    stats[name.lower()] = int(value)
-
-            if stat_name.lower() not in stats:
-                return {
-                    "stat_name": "属性未找到",
-                    "stat_value": -1
-                }
-
-            stat_value = stats[stat_name.lower()]
+            stat_value = pc_stat_cache.get(pc_number).get(stat_name)
+
+            if stat_value is None:
+                return StatResult("属性未找到", -1)
+
         except FileNotFoundError:
-            return {
-                "stat_name": "文件未找到",
-                "stat_value": -1
-            }
+            return StatResult("文件未找到", -1)
 
-        return (stat_name, stat_value)
+        return StatResult(stat_name, stat_value)
     
     @staticmethod
     def calculate_success_level(skill_level, skill_roll):
-        if skill_roll == 1:
-            success_level = "大成功"
-        elif (skill_level < 50 and skill_roll >= 96) or (skill_level >= 50 and skill_roll == 100):
-            success_level = "大失败"
-        elif skill_roll <= skill_level / 5:
-            success_level = "极限成功"
-        elif skill_roll <= skill_level / 2:
-            success_level = "困难成功"
-        elif skill_roll <= skill_level:
-            success_level = "成功"
-        else:
-            success_level = "失败"
-        return success_level
+        return SUCCESS_LEVELS[success_rank(skill_level, skill_roll)]
 
 router = APIRouter()
 
@@ -404,90 +558,205 @@ class RollRequest(BaseModel):
     a6: Optional[str] = None
     ip: Optional[str] = None
     time: Optional[str] = None
+    room: Optional[str] = None
+
+class ScriptRequest(BaseModel):
+    script: str
+    ip: Optional[str] = None
+    time: Optional[str] = None
+    room: Optional[str] = None
 
 class StatsUploadRequest(BaseModel):
     user_id: int
     stats: str
     create_new: bool = False
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        try:
-            message_str = message.decode('utf-8') if isinstance(message, bytes) else message
-            for connection in self.active_connections:
-                await connection.send_text(message_str)
-        except Exception as e:
-            logging.error(f"Error broadcasting message: {str(e)}")
-
-manager = ConnectionManager()
+class DistributionRequest(BaseModel):
+    expression: Optional[str] = None
+    modifier: Optional[int] = None
+
+class RivalOddsRequest(BaseModel):
+    skill1: Optional[int] = None
+    pc1: Optional[int] = None
+    skill1_name: Optional[str] = None
+    modifier1: int = 0
+    skill2: Optional[int] = None
+    pc2: Optional[int] = None
+    skill2_name: Optional[str] = None
+    modifier2: int = 0
+
+loop_monitor = EventLoopLagMonitor(interval=0.25)
+
+# Recent events per room, replayed to reconnecting clients (?since=<seq>) and served by /history
+event_history = EventHistory(capacity=int(os.environ.get('DICE_HISTORY_SIZE', 200)))
+
+manager = ConnectionManager(
+    bus=create_bus(BROADCAST_BUS),
+    coalesce_window=float(os.environ.get('DICE_BROADCAST_COALESCE_MS', 5)) / 1000,
+    history=event_history
+)
+
+UNKNOWN_COMMAND_ERROR = "无法识别命令，点击“操作指引”获取指令帮助。"
+MAX_COMMAND_ARGS = 6
+
+def parse_modifier(token):
+    value = parse_int(token)
+    if value is None:
+        raise InvalidModifierError(MODIFIER_ERROR)
+    return value
+
+class ArgSpec(NamedTuple):
+    name: str
+    parse: Callable[[str], object] = str
+    required: bool = True
+
+class CommandSpec(NamedTuple):
+    handler: Callable
+    args: Tuple[ArgSpec, ...]
+    # Extra tokens (up to MAX_COMMAND_ARGS) are passed through positionally, as rav/ravs need
+    variadic: bool = False
+    # Reads or writes character sheets, so it runs on the storage thread pool
+    storage: bool = False
+    # Handler takes the room's draws= source
+    rolls: bool = True
+    # Script lines only: splits the last token, e.g. ".sc 2 1/1d6"
+    script_split: Optional[str] = None
+    # Arguments holding dice expressions, counted against the dice limits before running
+    dice_args: Tuple[str, ...] = ()
+
+COMMANDS = {
+    'r': CommandSpec(DiceTool.roll_dice, (ArgSpec('command'),), dice_args=('command',)),
+    'rm': CommandSpec(DiceTool.advanced_roll_dice, (ArgSpec('modifier', parse_modifier),)),
+    'rd': CommandSpec(
+        DiceTool.pc_skill_roll,
+        (ArgSpec('pc_number'), ArgSpec('skill_name'), ArgSpec('modifier', parse_modifier, required=False)),
+        storage=True
+    ),
+    'rh': CommandSpec(DiceTool.secret_roll, (ArgSpec('command'),), dice_args=('command',)),
+    'rav': CommandSpec(partial(DiceTool.rival_roll, False), (ArgSpec('a1'), ArgSpec('a2')), variadic=True, storage=True),
+    'ravs': CommandSpec(partial(DiceTool.rival_roll, True), (ArgSpec('a1'), ArgSpec('a2')), variadic=True, storage=True),
+    'sc': CommandSpec(
+        DiceTool.sancheck,
+        (ArgSpec('pc_number'), ArgSpec('success_san_loss'), ArgSpec('fail_san_loss', required=False)),
+        storage=True, script_split='/', dice_args=('success_san_loss', 'fail_san_loss')
+    ),
+    'hp': CommandSpec(DiceTool.hp_adjust, (ArgSpec('pc_number'), ArgSpec('adjustment')), storage=True, dice_args=('adjustment',)),
+    'st': CommandSpec(DiceTool.get_stat, (ArgSpec('pc_number'), ArgSpec('stat_name')), storage=True, rolls=False),
+}
+
+# Commands that read or write character sheets; these run on the storage thread pool.
+STORAGE_COMMANDS = {name for name, spec in COMMANDS.items() if spec.storage}
+
+def parse_command_args(spec: CommandSpec, tokens):
+    """按命令的参数表解析参数，缺少必填参数时返回None。"""
+    # Like the old a1..a6 checks, arguments stop at the first empty slot
+    tokens = [token.strip() for token in takewhile(bool, tokens)]
+    if len(tokens) < sum(arg.required for arg in spec.args):
+        return None
+    if spec.variadic:
+        return tokens[:MAX_COMMAND_ARGS], {}
+    return [], {arg.name: arg.parse(token) for arg, token in zip(spec.args, tokens)}
+
+def request_tokens(request: RollRequest):
+    return (request.a1, request.a2, request.a3, request.a4, request.a5, request.a6)
+
+def request_dice_count(request: RollRequest):
+    """指令中骰子表达式的骰子总数；无法解析的参数记为0，留给指令本身报错。"""
+    spec = COMMANDS.get(request.command.lower())
+    if spec is None or not spec.dice_args:
+        return 0
+    dice_count = 0
+    for arg, token in zip(spec.args, request_tokens(request)):
+        if arg.name in spec.dice_args and token:
+            try:
+                dice_count += compile_dice_plan(token.strip().lstrip('+-')).dice_count
+            except DiceToolError:
+                pass
+    return dice_count
+
+# Per-(room, PC, skill) tallies of rd, rav/ravs and sc results, snapshotted to disk periodically
+# Workers sharing a bus would overwrite one snapshot file, so their tallies stay in memory
+roll_stats = RollStatistics(None if SHARED_WORKERS else os.environ.get('DICE_ROLL_STATS_PATH', './pcstats/roll_stats.json'))
+
+def record_roll_stats(request: RollRequest, result):
+    room = normalize_room(request.room)
+    if isinstance(result, SkillRollResult):
+        roll_stats.record(room, request.a1.strip(), canonical_name(result.skill_name), result.roll, result.success_rank)
+    elif isinstance(result, PCRivalResult):
+        roll_stats.record(room, result.pc1, canonical_name(result.skill1_name), result.roll1, result.success_rank1)
+        roll_stats.record(room, result.pc2, canonical_name(result.skill2_name), result.roll2, result.success_rank2)
+    elif isinstance(result, NPCvsPCRivalResult):
+        roll_stats.record(room, result.pc, canonical_name(result.skill_name), result.pc_roll, result.pc_success_rank)
+    elif isinstance(result, SanCheckResult):
+        roll_stats.record(room, request.a1.strip(), 'sc', result.roll, result.success_rank, result.reduction)
+
+# Results carry success ranks; the response and broadcast show the SUCCESS_LEVELS labels
+RANK_FIELDS = {
+    SkillRollResult: ('success_rank',),
+    PCRivalResult: ('success_rank1', 'success_rank2'),
+    NPCvsPCRivalResult: ('npc_success_rank', 'pc_success_rank'),
+    NPCRivalResult: ('success_rank1', 'success_rank2'),
+    SanCheckResult: ('success_rank',)
+}
+
+def labeled_result(result):
+    fields = RANK_FIELDS.get(type(result))
+    if fields is None:
+        return result
+    return result._replace(**{name: SUCCESS_LEVELS[getattr(result, name)] for name in fields})
+
+# Unknown commands share one label so a typo cannot create new series
+METRIC_COMMANDS = set(COMMANDS)
+COMMAND_SECONDS = metrics.histogram(
+    'dice_command_duration_seconds', 'Latency of /dice/roll requests by command.', ('command',)
+)
+COMMANDS_TOTAL = metrics.counter('dice_commands_total', 'Number of /dice/roll requests by command and outcome.', ('command', 'outcome'))
+metrics.gauge('dice_websocket_connections', 'Open WebSocket connections.', lambda: len(manager.active_connections))
+metrics.gauge('dice_websocket_rooms', 'Rooms with at least one open WebSocket.', lambda: len(manager.rooms))
+metrics.gauge('dice_event_loop_lag_last_seconds', 'Most recent event loop lag sample.', lambda: loop_monitor.lag_seconds_last)
+
+def execute_roll_command(request: RollRequest, draws=None):
+    spec = COMMANDS.get(request.command.lower())
+    parsed = parse_command_args(spec, request_tokens(request)) if spec is not None else None
+    if parsed is None:
+        logging.error(UNKNOWN_COMMAND_ERROR)
+        raise HTTPException(status_code=400, detail=UNKNOWN_COMMAND_ERROR)
+
+    args, kwargs = parsed
+    if spec.rolls:
+        # Each room draws from its own generator so seeded sessions replay independently
+        kwargs['draws'] = draws if draws is not None else dice_rng.for_room(normalize_room(request.room))
+    return spec.handler(*args, **kwargs)
+
+async def execute_roll_command_async(request: RollRequest, draws=None):
+    if request.command.lower() in STORAGE_COMMANDS:
+        return await run_blocking(execute_roll_command, request, draws)
+    if request_dice_count(request) > LARGE_ROLL_THRESHOLD:
+        # Summarized rolls can draw up to MAX_DICE_PER_REQUEST dice; keep them off the event loop
+        return await run_compute(execute_roll_command, request, draws)
+    return execute_roll_command(request, draws)
 
 @router.post("/roll")
 async def roll_dice(request: RollRequest):
+    command_label = request.command.lower() if request.command.lower() in METRIC_COMMANDS else 'other'
+    outcome = 'error'
+    started = time.perf_counter()
     try:
-        if request.command.lower() == 'r' and request.a1:
-            result = DiceTool.roll_dice(request.a1.strip())
-        elif request.command.lower() == 'rm' and request.a1:
-            result = DiceTool.advanced_roll_dice(request.a1.strip())
-        elif request.command.lower() == 'rd' and request.a1 and request.a2:
-            if request.a3:
-                try:
-                    a3 = int(request.a3)
-                except ValueError:
-                    logging.error("不合法的修正数值，修正数值为奖励骰的数量减去惩罚骰的数量。")
-                    raise HTTPException(status_code=400, detail="不合法的修正数值，修正数值为奖励骰的数量减去惩罚骰的数量。")
-                result = DiceTool.pc_skill_roll(request.a1.strip(), request.a2.strip(), a3)
-            else:
-                result = DiceTool.pc_skill_roll(request.a1.strip(), request.a2.strip())
-        elif request.command.lower() == 'rh' and request.a1:
-            result = DiceTool.secret_roll(request.a1.strip())
-        elif (request.command.lower() == 'rav' or request.command.lower() == 'ravs') and request.a1 and request.a2:
-            args = [request.a1.strip(), request.a2.strip()]
-            if request.a3:
-                args.append(request.a3.strip())
-                if request.a4:
-                    args.append(request.a4.strip())
-                    if request.a5:
-                        args.append(request.a5.strip())
-                        if request.a6:
-                            args.append(request.a6.strip())
-
-            if request.command.lower() == 'rav':
-                result = DiceTool.rival_roll(False, *args)
-            else:
-                result = DiceTool.rival_roll(True, *args)
-        elif request.command.lower() == 'sc' and request.a1 and request.a2:
-            if request.a3:
-                result = DiceTool.sancheck(request.a1.strip(), request.a2.strip(), request.a3.strip())
-            else:
-                result = DiceTool.sancheck(request.a1.strip(), request.a2.strip())
-        elif request.command.lower() == 'hp' and request.a1 and request.a2:
-            result = DiceTool.hp_adjust(request.a1.strip(), request.a2.strip())
-        elif request.command.lower() == 'st' and request.a1 and request.a2:
-            result = DiceTool.get_stat(request.a1.strip(), request.a2.strip())
-        else:
-            logging.error("无法识别命令，点击“操作指引”获取指令帮助。")
-            raise HTTPException(status_code=400, detail="无法识别命令，点击“操作指引”获取指令帮助。")
+        result = await execute_roll_command_async(request)
+        outcome = 'success'
+        record_roll_stats(request, result)
 
         response_data = {
             "command": request.command,
-            "result": result,
+            "result": labeled_result(result),
             "ip": request.ip,
             "time": request.time
         }
 
-        result_json = json.dumps(response_data, ensure_ascii=False).encode('utf-8')
-        await manager.broadcast(result_json)
-        return response_data  # Return the complete response_data including IP and time
+        # Encoded once for both the broadcast and the HTTP response
+        text = dumps(response_data)
+        await manager.broadcast(text, normalize_room(request.room))
+        return Response(content=text, media_type="application/json")
     except InvalidDiceTypeError as e:
         logging.error(f"Invalid dice type error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -510,7 +779,164 @@ async def roll_dice(request: RollRequest):
         raise e  # Re-raise HTTP exceptions to be handled as usual
     except Exception as e:
         logging.error(f"Error processing request: {str(e)}")
-        raise HTTPException(status_code=400, detail="无法识别命令，点击“操作指引”获取指令帮助。")
+        raise HTTPException(status_code=400, detail=UNKNOWN_COMMAND_ERROR)
+    finally:
+        COMMAND_SECONDS.observe(time.perf_counter() - started, command_label)
+        COMMANDS_TOTAL.inc(command_label, outcome)
+
+MAX_BATCH_SIZE = 50
+
+@router.post("/roll_batch")
+async def roll_batch(requests: List[RollRequest]):
+    if not requests or len(requests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"批量掷骰需要1-{MAX_BATCH_SIZE}条指令。")
+    # The combined result frame goes to a single room, so every item must belong to it
+    if len({normalize_room(request.room) for request in requests}) > 1:
+        raise HTTPException(status_code=400, detail="批量掷骰的所有指令必须属于同一个房间。")
+    return await run_roll_batch(requests)
+
+SCRIPT_PREFIXES = ('.', '。')
+
+def parse_script_line(number: int, line: str, script: ScriptRequest):
+    """把一行骰子机器人风格的指令（如“.rd 1 侦查”）解析为RollRequest，并预先校验参数。"""
+    tokens = line.lstrip(''.join(SCRIPT_PREFIXES)).split()
+    spec = COMMANDS.get(tokens[0].lower()) if tokens else None
+    if spec is None:
+        raise InvalidParameterError(f"第{number}行：{UNKNOWN_COMMAND_ERROR}")
+    args = tokens[1:]
+    if spec.script_split and args and len(args) == len(spec.args) - 1 and spec.script_split in args[-1]:
+        args = args[:-1] + args[-1].split(spec.script_split, 1)
+    if len(args) > MAX_COMMAND_ARGS:
+        raise InvalidParameterError(f"第{number}行：参数过多，最多{MAX_COMMAND_ARGS}个。")
+    try:
+        parsed = parse_command_args(spec, args)
+    except DiceToolError as e:
+        raise InvalidParameterError(f"第{number}行：{str(e)}")
+    if parsed is None:
+        raise InvalidParameterError(f"第{number}行：缺少参数。")
+    slots = dict(zip(('a1', 'a2', 'a3', 'a4', 'a5', 'a6'), args))
+    return RollRequest(command=tokens[0], ip=script.ip, time=script.time, room=script.room, **slots)
+
+@router.post("/exec")
+async def exec_script(script: ScriptRequest):
+    lines = [line.strip() for line in script.script.splitlines() if line.strip()]
+    if not lines or len(lines) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"脚本需要1-{MAX_BATCH_SIZE}行指令。")
+    try:
+        # The whole script is validated before any line runs
+        requests = [parse_script_line(number, line, script) for number, line in enumerate(lines, 1)]
+    except InvalidParameterError as e:
+        logging.error(f"Invalid script: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_roll_batch(requests, lines)
+
+async def run_roll_batch(requests: List[RollRequest], lines: Optional[List[str]] = None):
+    # One dice budget covers the whole batch, not each item
+    dice_count = sum(request_dice_count(request) for request in requests)
+    if dice_count > MAX_DICE_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"批量指令合计最多掷{MAX_DICE_PER_REQUEST}颗骰子。")
+    if any(request.command.lower() in STORAGE_COMMANDS for request in requests):
+        results = await run_blocking(execute_roll_batch, requests)
+    elif dice_count > LARGE_ROLL_THRESHOLD:
+        results = await run_compute(execute_roll_batch, requests)
+    else:
+        results = execute_roll_batch(requests)
+    if lines is not None:
+        for item, line in zip(results, lines):
+            item["line"] = line
+
+    response_data = {
+        "command": "batch",
+        "results": results,
+        "ip": requests[0].ip,
+        "time": requests[0].time
+    }
+
+    text = dumps(response_data)
+    await manager.broadcast(text, normalize_room(requests[0].room))
+    return Response(content=text, media_type="application/json")
+
+def execute_roll_batch(requests: List[RollRequest]):
+    results = []
+    for request in requests:
+        item = {
+            "command": request.command,
+            "ip": request.ip,
+            "time": request.time
+        }
+        try:
+            result = execute_roll_command(request)
+            record_roll_stats(request, result)
+            item["result"] = labeled_result(result)
+        except HTTPException as e:
+            item["error"] = e.detail
+        except (DiceToolError, InvalidParameterError) as e:
+            logging.error(f"Batch roll error: {str(e)}")
+            item["error"] = str(e)
+        except Exception as e:
+            logging.error(f"Error processing batch request: {str(e)}")
+            item["error"] = UNKNOWN_COMMAND_ERROR
+        results.append(item)
+    return results
+
+@router.post("/distribution")
+async def get_distribution(request: DistributionRequest):
+    try:
+        if request.expression:
+            plan = compile_dice_plan(request.expression)
+            if plan.dice_count > MAX_DISTRIBUTION_DICE:
+                raise InvalidDiceTypeError(f"概率计算最多支持{MAX_DISTRIBUTION_DICE}颗骰子。")
+            if plan_support(plan.terms) > MAX_DISTRIBUTION_SUPPORT:
+                raise InvalidDiceTypeError(f"概率计算的骰子总面数（数量×面数之和）最多为{MAX_DISTRIBUTION_SUPPORT}。")
+            summary = await run_compute(lambda: summarize_pmf(plan_pmf(plan.terms)))
+            expression = request.expression
+        elif request.modifier is not None:
+            summary = summarize_pmf(d100_modifier_pmf(request.modifier))
+            expression = "1d100"
+        else:
+            raise InvalidParameterError("请提供骰子表达式或奖励/惩罚骰修正值。")
+
+        return {"expression": expression, "modifier": request.modifier, **summary}
+    except (DiceToolError, InvalidParameterError) as e:
+        logging.error(f"Distribution error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/success_odds")
+async def get_success_odds(skill: Optional[int] = Query(None, ge=0, le=100), modifier: Optional[int] = Query(None, ge=-10, le=10)):
+    if skill is not None and modifier is not None:
+        odds = [round(p, 4) for p in success_probabilities(skill, modifier)]
+    elif skill is not None:
+        odds = success_probability_table()[skill]
+    else:
+        odds = success_probability_table()
+    return {"levels": SUCCESS_LEVELS, "odds": odds}
+
+@router.post("/rival_odds")
+async def get_rival_odds(request: RivalOddsRequest):
+    try:
+        sides = []
+        for skill, pc_number, skill_name, modifier in (
+            (request.skill1, request.pc1, request.skill1_name, request.modifier1),
+            (request.skill2, request.pc2, request.skill2_name, request.modifier2)
+        ):
+            if pc_number is not None and skill_name:
+                skill = await run_blocking(DiceTool.get_skill_value, pc_number, skill_name.strip())
+            elif skill is None:
+                raise InvalidParameterError("请为对抗双方提供技能值，或PC编号与技能名。")
+            sides.append((skill, max(-10, min(10, modifier))))
+
+        (skill1, modifier1), (skill2, modifier2) = sides
+        return {
+            "skill1": skill1,
+            "modifier1": modifier1,
+            "skill2": skill2,
+            "modifier2": modifier2,
+            "rav": rival_win_probability(skill1, modifier1, skill2, modifier2, False),
+            "ravs": rival_win_probability(skill1, modifier1, skill2, modifier2, True)
+        }
+    except (DiceToolError, InvalidParameterError) as e:
+        logging.error(f"Rival odds error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/upload_stats")
 async def upload_stats(request: StatsUploadRequest):
@@ -519,32 +945,7 @@ async def upload_stats(request: StatsUploadRequest):
             raise ValueError("用户ID取值范围为0-999")
         
         parsed_stats = parse_stats(request.stats)
-        
-        os.makedirs('./pcstats', exist_ok=True)
-        file_name = f'./pcstats/pc_file{request.user_id}.txt'
-
-        # Delete old files
-        delete_old_files('./pcstats', 30 * 24 * 60 * 60)  # 30 days
-        
-        # Handle create new file option
-        if request.create_new and os.path.exists(file_name):
-            os.remove(file_name)
-        
-        existing_stats = {}
-        if os.path.exists(file_name):
-            with open(file_name, 'r', encoding='utf-8') as file:
-                for line in file:
-                    if '|' in line:
-                        key, value = line.strip().split('|', 1)
-                        existing_stats[key] = value
-
-        for stat in parsed_stats:
-            key, value = stat.split('|', 1)
-            existing_stats[key] = value
-
-        with open(file_name, 'w', encoding='utf-8') as file:
-            for key, value in existing_stats.items():
-                file.write(f"{key}|{value}\n")
+        await run_blocking(save_uploaded_stats, request, parsed_stats)
         
         return {"status": "success"}
     except ValueError as ve:
@@ -554,31 +955,162 @@ async def upload_stats(request: StatsUploadRequest):
         logging.error(f"Error uploading stats: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to upload stats")
 
+def save_uploaded_stats(request: StatsUploadRequest, parsed_stats):
+    entries = [stat.split('|', 1) for stat in parsed_stats]
+    started = time.perf_counter()
+    pc_storage.upsert_sheet(request.user_id, entries, replace=request.create_new)
+    STORAGE_SECONDS.observe(time.perf_counter() - started, 'upsert')
+    pc_stat_cache.invalidate(request.user_id)
+    pc_reaper.touch(request.user_id)
+
+TRANSFER_FORMATS = ('ndjson', 'csv')
+
+def transfer_format(format: Optional[str], content_type: str = ''):
+    format = (format or ('csv' if 'csv' in content_type else 'ndjson')).lower()
+    if format not in TRANSFER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式：{format}，可选ndjson或csv")
+    return format
+
+# Like /upload_stats, imported stats are merged into existing sheets; ?replace=true overwrites them
+@router.post("/import_stats")
+async def import_stats(request: Request, format: Optional[str] = None, replace: bool = False):
+    format = transfer_format(format, request.headers.get('content-type', ''))
+    sheet_import = SheetImport(parse_stats)
+    header = None
+    try:
+        # The body is parsed line by line as it arrives
+        line_number = 0
+        async for line in iter_lines(request.stream()):
+            line_number += 1
+            if format == 'csv':
+                header = sheet_import.add_csv(line_number, line, header)
+            else:
+                sheet_import.add_ndjson(line_number, line)
+    except ValueError as ve:
+        logging.error(f"ValueError: {str(ve)}")
+        raise HTTPException(status_code=400, detail=str(ve))
+
+    sheets = sheet_import.finish()
+    if sheet_import.errors:
+        logging.error(f"Rejected stats import with {len(sheet_import.errors)} errors")
+        raise HTTPException(status_code=400, detail={"message": "导入失败，未写入任何角色卡", "errors": sheet_import.errors})
+
+    try:
+        await run_blocking(save_imported_sheets, sheets, replace)
+    except Exception as e:
+        logging.error(f"Error importing stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to import stats")
+    return {"status": "success", "imported": sorted(user_id for user_id, _ in sheets)}
+
+def save_imported_sheets(sheets, replace):
+    started = time.perf_counter()
+    pc_storage.import_sheets(sheets, replace=replace)
+    STORAGE_SECONDS.observe(time.perf_counter() - started, 'import')
+    for user_id, _ in sheets:
+        pc_stat_cache.invalidate(user_id)
+        pc_reaper.touch(user_id)
+
+@router.get("/export_stats")
+async def export_stats(format: Optional[str] = None):
+    format = transfer_format(format)
+    # Sheets are read one at a time while the response streams
+    if format == 'csv':
+        body, media_type = export_csv(pc_storage.iter_sheets()), "text/csv; charset=utf-8"
+    else:
+        body, media_type = export_ndjson(pc_storage.iter_sheets()), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="pcstats.{format}"'
+    })
+
 @router.get("/occupied_ids")
 async def get_occupied_ids():
     try:
-        files = os.listdir('./pcstats')
-        occupied_ids = [int(f[7:-4]) for f in files if f.startswith('pc_file') and f.endswith('.txt')]
+        occupied_ids = await run_blocking(pc_storage.occupied_ids)
         return {"occupied_ids": occupied_ids}
     except Exception as e:
         logging.error(f"Error fetching occupied IDs: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch occupied IDs")
 
+@router.get("/cache_stats")
+async def get_cache_stats():
+    return {**pc_stat_cache.info(), "expiry": pc_reaper.info()}
+
+@router.get("/rng_stats")
+async def get_rng_stats():
+    return dice_rng.info()
+
+@router.get("/history")
+async def get_history(
+    room: Optional[str] = None,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=200)
+):
+    room = normalize_room(room)
+    events, next_before, latest_seq = event_history.page(room, before, limit)
+    # Buffered events are already JSON text; splice them in rather than re-encoding
+    content = with_events(
+        {"room": room, "epoch": event_history.epoch, "latest_seq": latest_seq, "next_before": next_before}, events
+    )
+    return Response(content=content, media_type="application/json")
+
+@router.get("/stats/summary")
+async def get_roll_stats_summary(room: Optional[str] = None, pc: Optional[str] = None):
+    return {
+        "levels": SUCCESS_LEVELS,
+        **roll_stats.info(),
+        "rooms": roll_stats.summary(normalize_room(room) if room is not None else None, pc)
+    }
+
+@router.get("/connection_stats")
+async def get_connection_stats():
+    return manager.info()
+
+@router.get("/loop_stats")
+async def get_loop_stats():
+    return loop_monitor.info()
+
+# Fields the server sets on broadcast frames; clients may not supply them in chat messages
+RESERVED_EVENT_KEYS = ('seq', 'type', 'events', 'replay', 'truncated', 'epoch', 'latest_seq')
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     query_params = websocket.query_params
     username = query_params.get("username", "临时用户")
-    await manager.connect(websocket)
+    room = normalize_room(query_params.get("room"))
+    since = query_params.get("since")
+    await manager.connect(
+        websocket, room,
+        binary=query_params.get("format") == "msgpack",
+        since=int(since) if since and since.isdigit() else None,
+        epoch=query_params.get("epoch")
+    )
     try:
         while True:
             data = await websocket.receive_text()
             if data == 'ping':
-                await websocket.send_text('pong')
-            else:
-                message = json.loads(data)
-                message["username"] = username
-                await manager.broadcast(json.dumps(message))
+                manager.send(websocket, 'pong')
+                continue
+            try:
+                message = loads(data)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                manager.send(websocket, dumps({"type": "error", "detail": "消息必须是JSON对象"}))
+                continue
+            # Keep-alives are answered privately instead of being broadcast into the room history
+            if message.get("type") == "ping":
+                manager.send(websocket, dumps({"type": "pong"}))
+                continue
+            for key in RESERVED_EVENT_KEYS:
+                message.pop(key, None)
+            message["username"] = username
+            await manager.broadcast(dumps(message), room)
     except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logging.error(f"Error in websocket connection: {str(e)}")
+    finally:
+        # Whatever ends the loop, the socket leaves its room and its sender task is cancelled
         manager.disconnect(websocket)
 
 def parse_stats(stats: str):
@@ -592,20 +1124,12 @@ def parse_stats(stats: str):
     if not matches:
         raise ValueError("属性格式错误，请遵循角色创建表中的格式或点击“操作指引”获取帮助")
 
-    parsed_stats = []
+    # Aliases (力量/str, 理智/san, ...) collapse onto one canonical entry
+    parsed = {}
     for string, digit in matches:
-        parsed_stats.append(f"{string}|{digit}")
-        if string in ["san", "hp", "mp"]:
-            parsed_stats.append(f"current_{string}|{digit}")
-
-    return parsed_stats
-
-def delete_old_files(directory: str, max_age_seconds: int):
-    current_time = time.time()
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-        if os.path.isfile(file_path):
-            file_age = current_time - os.path.getmtime(file_path)
-            if file_age > max_age_seconds:
-                os.remove(file_path)
-                logging.info(f"Deleted old file: {file_path}")
+        name = canonical_name(string)
+        parsed[name] = digit
+        if name in TRACKED_ATTRIBUTES:
+            parsed[f"current_{name}"] = digit
+
+    return [f"{name}|{digit}" for name, digit in parsed.items()]
@@ -0,0 +1,202 @@
+"""构建静态资源：带内容哈希的文件名、预压缩的gzip/brotli副本，可选地把字体子集化为WOFF2。
+
+    python -m services.asset_build [--source static] [--subset-fonts]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+
+# brotli and fontTools are optional; without them only gzip variants are written and fonts are skipped.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ENTRY_PAGE = 'index.html'
+TEXT_EXTENSIONS = ('.html', '.css', '.js')
+# Variants that do not save at least this fraction are not worth a separate file
+MIN_COMPRESSION_SAVING = 0.1
+REFERENCE_PATTERN = re.compile(r'/static/([\w./-]+)')
+mimetypes.add_type('font/woff2', '.woff2')
+# (file, family, weight, style) for the faces styles.css names
+FONT_FACES = (
+    ('NotoSans-Regular.ttf', 'NotoSans', 400, 'normal'),
+    ('NotoSans-Bold.ttf', 'NotoSans', 700, 'normal'),
+    ('NotoSans-Italic.ttf', 'NotoSans', 400, 'italic'),
+    ('SourceCodePro-Regular.ttf', 'SourceCodePro', 400, 'normal'),
+    ('SourceCodePro-Bold.ttf', 'SourceCodePro', 700, 'normal'),
+    ('SourceCodePro-Italic.ttf', 'SourceCodePro', 400, 'italic'),
+)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hashed_name(name, digest):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:12]}{ext}"
+
+
+def media_type_for(name):
+    media_type, _ = mimetypes.guess_type(name)
+    if media_type is None:
+        return 'application/octet-stream'
+    if media_type.startswith('text/') or media_type in ('application/javascript', 'image/svg+xml'):
+        return f"{media_type}; charset=utf-8"
+    return media_type
+
+
+def compress_variants(data):
+    """返回值得保存的压缩副本 {编码: 字节}，优先brotli。"""
+    variants = {}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    # mtime=0 keeps the output byte-identical between builds
+    variants['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+    limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+    return {encoding: body for encoding, body in variants.items() if len(body) <= limit}
+
+
+def rewrite_references(text, urls):
+    return REFERENCE_PATTERN.sub(lambda match: urls.get(match.group(1), match.group(0)), text)
+
+
+def subset_font(path, text):
+    """把字体裁剪为只包含text中字符的WOFF2。"""
+    options = font_subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = ['*']
+    font = font_subset.load_font(path, options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+    target = path + '.subset'
+    try:
+        font_subset.save_font(font, target, options)
+        with open(target, 'rb') as file:
+            return file.read()
+    finally:
+        font.close()
+        if os.path.exists(target):
+            os.remove(target)
+
+
+def font_face_rules(fonts):
+    return ''.join(
+        f"\n@font-face {{\n    font-family: '{family}';\n    src: url('/static/{name}') format('woff2');\n"
+        f"    font-weight: {weight};\n    font-style: {style};\n    font-display: swap;\n}}\n"
+        for name, family, weight, style in fonts
+    )
+
+
+class AssetBuilder:
+    """把source目录中页面引用到的资源写入source/dist，并生成清单供StaticAssets使用。"""
+
+    def __init__(self, source='static'):
+        self.source = source
+        self.output = os.path.join(source, DIST_DIR)
+        # logical name -> public URL of the hashed copy
+        self.urls = {}
+        # path relative to source -> serving metadata
+        self.files = {}
+
+    def read(self, name):
+        with open(os.path.join(self.source, name), 'rb') as file:
+            return file.read()
+
+    def emit(self, name, data, immutable=True):
+        digest = content_hash(data)
+        target = os.path.join(DIST_DIR, hashed_name(name, digest) if immutable else name)
+        full_path = os.path.join(self.source, target)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as file:
+            file.write(data)
+        variants = compress_variants(data)
+        for encoding, body in variants.items():
+            with open(f"{full_path}.{'gz' if encoding == 'gzip' else encoding}", 'wb') as file:
+                file.write(body)
+        key = target.replace(os.sep, '/')
+        self.files[key] = {
+            "media_type": media_type_for(name),
+            "etag": digest[:32],
+            "immutable": immutable,
+            "encodings": list(variants)
+        }
+        self.urls[name] = f"/static/{key}"
+        return key
+
+    def referenced(self, text):
+        return [name for name in dict.fromkeys(REFERENCE_PATTERN.findall(text)) if name not in self.urls]
+
+    def build(self, subset_fonts=False):
+        shutil.rmtree(self.output, ignore_errors=True)
+        page = self.read(ENTRY_PAGE).decode('utf-8')
+        fonts = self.build_fonts(page) if subset_fonts else []
+
+        # Leaves first so text assets can point at their hashed URLs
+        names = self.referenced(page)
+        for name in sorted(names, key=lambda name: name.endswith(TEXT_EXTENSIONS)):
+            if not os.path.isfile(os.path.join(self.source, name)):
+                logging.error(f"Referenced asset not found: {name}")
+                continue
+            data = self.read(name)
+            if name.endswith(TEXT_EXTENSIONS):
+                text = data.decode('utf-8')
+                if name.endswith('.css') and fonts:
+                    text += font_face_rules(fonts)
+                data = rewrite_references(text, self.urls).encode('utf-8')
+            self.emit(name, data)
+
+        # The page itself keeps its name and is revalidated rather than cached forever
+        self.emit(ENTRY_PAGE, rewrite_references(page, self.urls).encode('utf-8'), immutable=False)
+        manifest = {"assets": self.urls, "files": self.files}
+        with open(os.path.join(self.output, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        return manifest
+
+    def build_fonts(self, page):
+        if font_subset is None or brotli is None:
+            logging.error("Font subsetting needs fontTools and brotli; fonts were skipped")
+            return []
+        # Every glyph the UI itself renders, plus printable ASCII for what players type
+        text = page + ''.join(self.read(name).decode('utf-8') for name in ('main.js', 'styles.css'))
+        text = ''.join(sorted(set(text) | set(map(chr, range(0x20, 0x7f)))))
+        fonts = []
+        for filename, family, weight, style in FONT_FACES:
+            path = os.path.join(self.source, 'fonts', filename)
+            if not os.path.isfile(path):
+                continue
+            name = f"fonts/{os.path.splitext(filename)[0]}.woff2"
+            key = self.emit(name, subset_font(path, text))
+            fonts.append((key, family, weight, style))
+        return fonts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default='static')
+    parser.add_argument('--subset-fonts', action='store_true', help='emit WOFF2 subsets and @font-face rules')
+    args = parser.parse_args(argv)
+    manifest = AssetBuilder(args.source).build(subset_fonts=args.subset_fonts)
+    for name, url in manifest["assets"].items():
+        entry = manifest["files"][url[len('/static/'):]]
+        print(f"{name} -> {url} [{', '.join(entry['encodings']) or 'identity'}]")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(message)s')
+    main()
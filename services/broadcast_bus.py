@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+
+# fcntl is Unix-only; without it only the in-process bus is available.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Frames are newline-delimited JSON; batch results can be large, so raise the stream line limit.
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class InProcessBus:
+    """默认的进程内广播：直接交给本进程的ConnectionManager。"""
+
+    def bind(self, deliver):
+        self._deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def publish(self, room, message):
+        self._deliver(room, message)
+
+
+class UnixSocketBus:
+    """通过Unix域套接字在同一台机器的多个worker之间转发广播。
+
+    抢到锁文件的worker作为中转站监听套接字，其余worker作为客户端连接；
+    中转站退出后，客户端会重新竞争锁并接替。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._deliver = None
+        self._lock_fd = None
+        self._server = None
+        self._peers = set()
+        self._upstream = None
+        self._follower = None
+        self._joining = None
+
+    def bind(self, deliver):
+        self._deliver = deliver
+
+    @property
+    def is_hub(self):
+        return self._server is not None
+
+    async def start(self):
+        if self._server is not None or self._upstream is not None:
+            return
+        if self._joining is None:
+            self._joining = asyncio.ensure_future(self._join())
+        try:
+            await asyncio.shield(self._joining)
+        finally:
+            if self._joining is not None and self._joining.done():
+                self._joining = None
+
+    def _try_lock(self):
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _join(self):
+        while True:
+            if self._try_lock():
+                if os.path.exists(self.path):
+                    os.unlink(self.path)  # Left behind by a hub that died
+                self._server = await asyncio.start_unix_server(self._serve_peer, path=self.path, limit=STREAM_LIMIT)
+                return
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)
+                continue
+            self._upstream = writer
+            self._follower = asyncio.create_task(self._follow(reader))
+            return
+
+    async def _follow(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                room, message = json.loads(line)
+                self._deliver(room, message)
+        except Exception as e:
+            logging.error(f"Broadcast bus connection lost: {str(e)}")
+        self._upstream = None
+        # The hub went away; compete for the lock again and either take over or reconnect.
+        await self.start()
+
+    async def _serve_peer(self, reader, writer):
+        self._peers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                room, message = json.loads(line)
+                self._deliver(room, message)
+                await self._forward(line, exclude=writer)
+        except Exception as e:
+            logging.error(f"Broadcast bus peer error: {str(e)}")
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def _forward(self, line, exclude=None):
+        peers = [peer for peer in self._peers if peer is not exclude]
+        for peer in peers:
+            peer.write(line)
+        results = await asyncio.gather(*(peer.drain() for peer in peers), return_exceptions=True)
+        for peer, result in zip(peers, results):
+            if isinstance(result, Exception):
+                self._peers.discard(peer)
+                peer.close()
+
+    async def publish(self, room, message):
+        await self.start()
+        self._deliver(room, message)
+        line = json.dumps([room, message], ensure_ascii=False).encode('utf-8') + b'\n'
+        if self._server is not None:
+            await self._forward(line)
+        elif self._upstream is not None:
+            try:
+                self._upstream.write(line)
+                await self._upstream.drain()
+            except Exception as e:
+                logging.error(f"Error publishing to broadcast bus: {str(e)}")
+
+
+def create_bus(url=None):
+    """根据配置创建广播总线：空值为进程内广播，unix:/path 为Unix域套接字。"""
+    if not url or url == 'memory':
+        return InProcessBus()
+    if url.startswith('unix:'):
+        if fcntl is None or not hasattr(asyncio, 'start_unix_server'):
+            raise ValueError("The unix: broadcast bus is not supported on this platform")
+        return UnixSocketBus(url[len('unix:'):])
+    raise ValueError(f"Unsupported broadcast bus: {url}")
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set
+from fastapi import WebSocket
+from services.broadcast_bus import InProcessBus
+from services.metrics import metrics
+from services.serialization import Frame, binary_supported
+
+DEFAULT_ROOM = 'default'
+MAX_ROOM_NAME_LENGTH = 64
+
+FANOUT_SECONDS = metrics.histogram(
+    'dice_broadcast_fanout_seconds', 'Time spent queueing one broadcast frame for every socket in a room.'
+)
+
+
+def normalize_room(room):
+    room = (room or '').strip()[:MAX_ROOM_NAME_LENGTH]
+    return room or DEFAULT_ROOM
+
+
+class ConnectionManager:
+    """WebSocket连接管理：每个连接有独立的有界发送队列和发送任务，慢连接不会拖慢其他人。"""
+
+    def __init__(self, queue_size=100, send_timeout=10.0, bus=None, coalesce_window=0.005, history=None):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.active_connections: List[WebSocket] = []
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self._room_of: Dict[WebSocket, str] = {}
+        self._binary: Set[WebSocket] = set()
+        # Events for a room that arrive within coalesce_window seconds go out as one bundle frame.
+        self.coalesce_window = coalesce_window
+        self._pending: Dict[str, List[str]] = {}
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        self.broadcasts = 0
+        self.evictions = 0
+        self.delivered = 0
+        self.delivery_seconds_total = 0.0
+        self.delivery_seconds_max = 0.0
+        self.fanout_seconds_total = 0.0
+        # Optional EventHistory that stamps each event with a seq and keeps it for reconnects.
+        self.history = history
+        # Broadcasts go through the bus so other worker processes see them too.
+        self.bus = bus if bus is not None else InProcessBus()
+        self.bus.bind(self.deliver)
+
+    async def connect(
+        self, websocket: WebSocket, room: str = DEFAULT_ROOM, binary: bool = False,
+        since: Optional[int] = None, epoch: Optional[str] = None
+    ):
+        await self.bus.start()
+        await websocket.accept()
+        if binary and binary_supported():
+            self._binary.add(websocket)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.history is not None:
+            # Every connection starts with the history epoch; reconnects also get the missed events, ahead of anything live.
+            events, truncated = self.history.since(room, since, epoch) if since is not None else ([], False)
+            queue.put_nowait((time.perf_counter(), Frame.bundle(
+                events, replay=True, truncated=truncated, epoch=self.history.epoch, latest_seq=self.history.last_seq
+            )))
+        self.active_connections.append(websocket)
+        # Rooms are created on first join and dropped when the last subscriber leaves.
+        self.rooms.setdefault(room, set()).add(websocket)
+        self._room_of[websocket] = room
+        self._queues[websocket] = queue
+        self._senders[websocket] = asyncio.create_task(self._drain(websocket, queue))
+
+    def disconnect(self, websocket: WebSocket):
+        # May run twice for one socket: once on eviction and again when its receive loop ends.
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        self._binary.discard(websocket)
+        room = self._room_of.pop(websocket, None)
+        if room is not None:
+            members = self.rooms.get(room)
+            if members is not None:
+                members.discard(websocket)
+                if not members:
+                    del self.rooms[room]
+        self._queues.pop(websocket, None)
+        sender = self._senders.pop(websocket, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+
+    def send(self, websocket: WebSocket, message: str):
+        queue = self._queues.get(websocket)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait((time.perf_counter(), message))
+        except asyncio.QueueFull:
+            logging.error(f"Evicting websocket client that fell {self.queue_size} messages behind")
+            self.evict(websocket)
+
+    def evict(self, websocket: WebSocket):
+        self.evictions += 1
+        self.disconnect(websocket)
+        asyncio.get_running_loop().create_task(self._close(websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+
+    async def _drain(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                queued_at, message = await queue.get()
+                if not isinstance(message, Frame):
+                    sending = websocket.send_text(message)
+                elif websocket in self._binary:
+                    sending = websocket.send_bytes(message.binary)
+                else:
+                    sending = websocket.send_text(message.text)
+                await asyncio.wait_for(sending, self.send_timeout)
+                elapsed = time.perf_counter() - queued_at
+                self.delivered += 1
+                self.delivery_seconds_total += elapsed
+                self.delivery_seconds_max = max(self.delivery_seconds_max, elapsed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error sending to websocket client: {str(e)}")
+            self.evict(websocket)
+
+    def room_of(self, websocket: WebSocket):
+        return self._room_of.get(websocket, DEFAULT_ROOM)
+
+    async def broadcast(self, message: str, room: str = DEFAULT_ROOM):
+        message_str = message.decode('utf-8') if isinstance(message, bytes) else message
+        await self.bus.publish(room, message_str)
+
+    def deliver(self, room: str, message_str: str):
+        if self.history is not None:
+            message_str = self.history.record(room, message_str)
+        if room not in self.rooms:
+            return
+        if self.coalesce_window <= 0:
+            self._fan_out(room, Frame(message_str))
+            return
+        pending = self._pending.get(room)
+        if pending is None:
+            self._pending[room] = [message_str]
+            asyncio.get_running_loop().call_later(self.coalesce_window, self._flush, room)
+        else:
+            pending.append(message_str)
+
+    def _flush(self, room: str):
+        events = self._pending.pop(room, None)
+        if events:
+            self._fan_out(room, Frame(events[0]) if len(events) == 1 else Frame.bundle(events))
+
+    def _fan_out(self, room: str, frame: Frame):
+        started = time.perf_counter()
+        for connection in list(self.rooms.get(room, ())):
+            self.send(connection, frame)
+        elapsed = time.perf_counter() - started
+        self.broadcasts += 1
+        self.fanout_seconds_total += elapsed
+        FANOUT_SECONDS.observe(elapsed)
+
+    def info(self):
+        depths = [queue.qsize() for queue in self._queues.values()]
+        return {
+            "connections": len(self.active_connections),
+            "rooms": len(self.rooms),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "broadcasts": self.broadcasts,
+            "evictions": self.evictions,
+            "delivered": self.delivered,
+            "fanout_seconds_avg": self.fanout_seconds_total / self.broadcasts if self.broadcasts else 0.0,
+            "delivery_seconds_avg": self.delivery_seconds_total / self.delivered if self.delivered else 0.0,
+            "delivery_seconds_max": self.delivery_seconds_max,
+            "history": self.history.info() if self.history is not None else None
+        }
@@ -0,0 +1,183 @@
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate
+from operator import sub
+
+# Each die costs one moving-window pass over the distribution so far, so both the
+# number of dice (passes) and the support size (pass length) are bounded.
+MAX_DISTRIBUTION_DICE = 100
+MAX_DISTRIBUTION_SUPPORT = 5000
+PERCENTILES = (5, 25, 50, 75, 95)
+SUCCESS_LEVELS = ('大成功', '极限成功', '困难成功', '成功', '失败', '大失败')
+CRITICAL, EXTREME, HARD, REGULAR, FAILURE, FUMBLE = range(len(SUCCESS_LEVELS))
+
+
+def add_dice(weights, count, sides):
+    """把count个sides面骰逐个加到（未归一化的）分布上：每颗骰子是一次前缀和上的滑动窗口。"""
+    pad = [0.0] * (sides - 1)
+    for _ in range(count):
+        prefix = [*pad, 0.0, *accumulate(weights)]
+        prefix.extend([prefix[-1]] * (sides - 1))
+        weights = list(map(sub, prefix[sides:], prefix))
+    return weights
+
+
+def plan_support(terms):
+    return sum(count * sides for _, count, sides in terms)
+
+
+def merge_terms(terms):
+    """合并同符号同面数的骰子项，常数项折叠为偏移量：返回((符号, 面数, 数量), ...)与常数。"""
+    dice = Counter()
+    constant = 0
+    for sign, count, sides in terms:
+        if sides:
+            dice[sign, sides] += count
+        else:
+            constant += sign * count
+    return tuple(sorted((sign, sides, count) for (sign, sides), count in dice.items() if count)), constant
+
+
+def plan_pmf(terms):
+    """按DicePlan的各项(符号, 数量, 面数)计算整个表达式的分布。"""
+    return merged_plan_pmf(*merge_terms(terms))
+
+
+@lru_cache(maxsize=128)
+def merged_plan_pmf(groups, constant):
+    offset = constant
+    # Outcome counts stay below 100 ** MAX_DISTRIBUTION_DICE, well within float range, so normalize once at the end
+    weights = [1.0]
+    outcomes = 1
+    for sign, sides, count in groups:
+        weights = add_dice(weights, count, sides)
+        outcomes *= sides ** count
+        # A negative die spans -sides..-1: the same window, shifted down instead of up
+        offset += count if sign > 0 else -count * sides
+    scale = 1.0 / outcomes
+    return (offset, tuple(weight * scale for weight in weights))
+
+
+@lru_cache(maxsize=32)
+def d100_modifier_pmf(modifier):
+    """与advanced_roll_dice规则一致的奖励/惩罚骰d100分布。"""
+    modifier = max(-10, min(10, modifier))
+    rolls = 1 + abs(modifier)
+    total = 10 ** rolls
+    probs = [0.0] * 100
+    for tens in range(10):
+        if modifier > 0:
+            tens_prob = ((10 - tens) ** rolls - (9 - tens) ** rolls) / total
+        else:
+            tens_prob = ((tens + 1) ** rolls - tens ** rolls) / total
+        for unit in range(10):
+            result = 10 * tens + unit
+            if result == 0:
+                result = 100
+            probs[result - 1] += tens_prob / 10
+    return (1, tuple(probs))
+
+
+def _success_rank(skill_level, skill_roll):
+    if skill_roll == 1:
+        return CRITICAL
+    elif (skill_level < 50 and skill_roll >= 96) or (skill_level >= 50 and skill_roll == 100):
+        return FUMBLE
+    elif skill_roll <= skill_level / 5:
+        return EXTREME
+    elif skill_roll <= skill_level / 2:
+        return HARD
+    elif skill_roll <= skill_level:
+        return REGULAR
+    return FAILURE
+
+
+# SUCCESS_RANK_TABLE[skill][roll] for skills and rolls 0-100; index into SUCCESS_LEVELS for the label.
+SUCCESS_RANK_TABLE = tuple(
+    bytes(_success_rank(skill, roll) for roll in range(101)) for skill in range(101)
+)
+
+
+def success_rank(skill_level, skill_roll):
+    if 0 <= skill_level <= 100 and 0 <= skill_roll <= 100:
+        return SUCCESS_RANK_TABLE[skill_level][skill_roll]
+    return _success_rank(skill_level, skill_roll)
+
+
+@lru_cache(maxsize=None)
+def success_probabilities(skill_level, modifier):
+    """给定技能值和奖励/惩罚骰修正时各成功等级的概率，顺序同SUCCESS_LEVELS。"""
+    offset, probs = d100_modifier_pmf(modifier)
+    ranks = [0.0] * len(SUCCESS_LEVELS)
+    for i, p in enumerate(probs):
+        ranks[success_rank(skill_level, offset + i)] += p
+    return tuple(ranks)
+
+
+@lru_cache(maxsize=1)
+def success_probability_table():
+    return {
+        skill: {
+            modifier: [round(p, 4) for p in success_probabilities(skill, modifier)]
+            for modifier in range(-10, 11)
+        }
+        for skill in range(101)
+    }
+
+
+def first_wins(strict_mode, rank1, skill1, roll1, rank2, skill2, roll2):
+    """对抗骰胜负判定：严格模式下前者成功等级必须更高，否则依次比较成功等级、技能值、出目。"""
+    if strict_mode:
+        return rank1 < rank2
+    if rank1 != rank2:
+        return rank1 < rank2
+    if skill1 != skill2:
+        return skill1 > skill2
+    return roll1 < roll2
+
+
+@lru_cache(maxsize=4096)
+def rival_win_probability(skill1, modifier1, skill2, modifier2, strict_mode):
+    offset1, probs1 = d100_modifier_pmf(modifier1)
+    offset2, probs2 = d100_modifier_pmf(modifier2)
+    second = [
+        (offset2 + j, success_rank(skill2, offset2 + j), q) for j, q in enumerate(probs2) if q
+    ]
+    probability = 0.0
+    for i, p in enumerate(probs1):
+        if not p:
+            continue
+        roll1 = offset1 + i
+        rank1 = success_rank(skill1, roll1)
+        for roll2, rank2, q in second:
+            if first_wins(strict_mode, rank1, skill1, roll1, rank2, skill2, roll2):
+                probability += p * q
+    return probability
+
+
+def summarize_pmf(pmf):
+    offset, probs = pmf
+    mean = sum((offset + i) * p for i, p in enumerate(probs))
+    variance = sum((offset + i - mean) ** 2 * p for i, p in enumerate(probs))
+
+    percentiles = {}
+    targets = iter(PERCENTILES)
+    target = next(targets)
+    cumulative = 0.0
+    for i, p in enumerate(probs):
+        cumulative += p
+        # Tolerate float rounding so the 100th mass point still closes out every target.
+        while target is not None and cumulative >= target / 100 - 1e-12:
+            percentiles[target] = offset + i
+            target = next(targets, None)
+        if target is None:
+            break
+
+    return {
+        "min": offset,
+        "max": offset + len(probs) - 1,
+        "mean": mean,
+        "stdev": variance ** 0.5,
+        "percentiles": percentiles,
+        "pmf": {offset + i: p for i, p in enumerate(probs) if p}
+    }
@@ -0,0 +1,149 @@
+import itertools
+import os
+import random
+import secrets
+import threading
+from array import array
+from collections import OrderedDict
+
+WORD_RANGE = 1 << 32
+DEFAULT_BLOCK_WORDS = 4096
+# Draws up to this many dice index the buffer directly instead of slicing it
+SMALL_TAKE = 8
+
+
+class BufferedRNG:
+    """批量取随机字并缓存，骰子从缓冲区取值；非2的幂面数用拒绝采样保证无偏。"""
+
+    def __init__(self, source, block_words=DEFAULT_BLOCK_WORDS):
+        # source(n) returns n random bytes
+        self.source = source
+        self.block_words = block_words
+        self.draws = 0
+        self.refills = 0
+        self._words = array('I')
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        words = array('I')
+        words.frombytes(self.source(self.block_words * words.itemsize))
+        self._words = words
+        self._position = 0
+        self.refills += 1
+
+    def _next_words(self, count):
+        words = self._words[self._position:self._position + count]
+        self._position += len(words)
+        while len(words) < count:
+            self._refill()
+            more = self._words[:count - len(words)]
+            self._position = len(more)
+            words.extend(more)
+        return words
+
+    def take(self, low, high, count):
+        span = high - low + 1
+        if span <= 1:
+            return [low] * count
+        if span > WORD_RANGE:
+            raise ValueError(f"Range too large for a 32-bit draw: {low}..{high}")
+        # Words at or above limit would favour low faces; powers of two never reject.
+        limit = WORD_RANGE - WORD_RANGE % span
+        results = []
+        with self._lock:
+            if count <= SMALL_TAKE:
+                # Same words in the same order as the batched path, so seeded sequences do not change
+                words, position, end = self._words, self._position, len(self._words)
+                remaining = count
+                while remaining:
+                    if position >= end:
+                        self._refill()
+                        words, position, end = self._words, 0, len(self._words)
+                    word = words[position]
+                    position += 1
+                    if word < limit:
+                        results.append(low + word % span)
+                        remaining -= 1
+                self._position = position
+                self.draws += count
+                return results
+            while len(results) < count:
+                words = self._next_words(count - len(results))
+                results.extend(low + word % span for word in words if word < limit)
+            self.draws += count
+        return results
+
+    def randint(self, low, high):
+        return self.take(low, high, 1)[0]
+
+    def info(self):
+        with self._lock:
+            return {"draws": self.draws, "refills": self.refills}
+
+
+class RNGService:
+    """按配置提供骰子随机源：fast为共享伪随机，crypto为系统熵源，seeded为每个房间独立的可复现序列。
+
+    seeded模式的种子混入每次启动的随机nonce（可通过/rng_stats查看），用同一种子和nonce即可复现一局。
+    """
+
+    MODES = ('fast', 'crypto', 'seeded')
+
+    def __init__(self, mode='fast', seed=None, block_words=DEFAULT_BLOCK_WORDS, nonce=None, max_rooms=1000):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported RNG mode: {mode}")
+        self.mode = mode
+        self.seed = seed
+        # Without a fresh nonce every restart would replay last session's rolls to anyone who kept its history
+        self.nonce = nonce or secrets.token_hex(8)
+        self.block_words = block_words
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        # Counts generator creations, so a room evicted and joined again does not restart its sequence
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+        if mode == 'crypto':
+            self._shared = BufferedRNG(os.urandom, block_words)
+        else:
+            self._shared = BufferedRNG(random.Random().randbytes, block_words)
+
+    def for_room(self, room):
+        if self.mode != 'seeded':
+            return self._shared
+        with self._lock:
+            rng = self._rooms.get(room)
+            if rng is not None:
+                self._rooms.move_to_end(room)
+                return rng
+            # Same seed, nonce and order of room creation give the same sequences, so a session replays roll for roll.
+            generation = next(self._generations)
+            source = random.Random(f"{self.seed}:{self.nonce}:{room}:{generation}").randbytes
+            rng = self._rooms[room] = BufferedRNG(source, self.block_words)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+            return rng
+
+    def reset(self, room):
+        with self._lock:
+            self._rooms.pop(room, None)
+
+    def info(self):
+        with self._lock:
+            rooms = dict(self._rooms)
+        info = {"mode": self.mode, **self._shared.info()}
+        if self.mode == 'seeded':
+            info["nonce"] = self.nonce
+            info["rooms"] = {room: rng.info() for room, rng in rooms.items()}
+        return info
+
+
+def create_rng(url=None, nonce=None):
+    """根据配置选择随机源：空值或fast、crypto、seeded:<种子>；nonce用于复现某次seeded会话。"""
+    if not url or url == 'fast':
+        return RNGService('fast')
+    if url == 'crypto':
+        return RNGService('crypto')
+    if url.startswith('seeded:'):
+        return RNGService('seeded', seed=url[len('seeded:'):], nonce=nonce)
+    raise ValueError(f"Unsupported RNG: {url}")
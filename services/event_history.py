@@ -0,0 +1,103 @@
+import itertools
+import secrets
+import threading
+from collections import OrderedDict, deque
+
+
+class RoomHistory:
+    __slots__ = ('events', 'floor')
+
+    def __init__(self, capacity, floor):
+        # (seq, text) pairs, oldest first; deque drops the oldest once full
+        self.events = deque(maxlen=capacity)
+        # Events at or below floor are no longer (or never were) in this buffer
+        self.floor = floor
+
+
+class EventHistory:
+    """按房间保存最近广播事件的环形缓冲区，事件带单调递增的序号，用于断线重连补发和历史分页。"""
+
+    def __init__(self, capacity=200, max_rooms=1000):
+        self.capacity = capacity
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        # Last seq of each room whose buffer was evicted; events at or below it are gone
+        self._evicted = OrderedDict()
+        # Highest last seq among evictions no longer tracked individually, applied to every unknown room
+        self._forgotten = 0
+        self._sequence = itertools.count(1)
+        self._last_seq = 0
+        # Seqs restart with every process (and differ between workers), so clients compare epochs before trusting them
+        self.epoch = secrets.token_hex(8)
+        self._lock = threading.Lock()
+
+    def record(self, room, text):
+        # Only JSON objects can carry a seq field; anything else is passed through unrecorded.
+        if not text.startswith('{'):
+            return text
+        with self._lock:
+            seq = self._last_seq = next(self._sequence)
+            history = self._rooms.get(room)
+            if history is None:
+                history = self._rooms[room] = RoomHistory(self.capacity, self._evicted.pop(room, self._forgotten))
+                while len(self._rooms) > self.max_rooms:
+                    self._evict()
+            else:
+                self._rooms.move_to_end(room)
+            if len(history.events) == history.events.maxlen:
+                history.floor = history.events[0][0]
+            stamped = f'{{"seq":{seq},' + text[1:] if len(text) > 2 else f'{{"seq":{seq}}}'
+            history.events.append((seq, stamped))
+        return stamped
+
+    def _evict(self):
+        room, history = self._rooms.popitem(last=False)
+        self._evicted[room] = history.events[-1][0] if history.events else history.floor
+        while len(self._evicted) > self.max_rooms:
+            _, last = self._evicted.popitem(last=False)
+            self._forgotten = max(self._forgotten, last)
+
+    def _floor(self, room):
+        return self._evicted.get(room, self._forgotten)
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self._last_seq
+
+    def since(self, room, seq, epoch=None):
+        """返回序号大于seq的事件，以及中间是否有事件已丢失。
+
+        epoch与本进程不同或seq超前时，客户端的seq来自别的进程：补发整个缓冲区并标记为不完整。
+        """
+        with self._lock:
+            reset = (epoch is not None and epoch != self.epoch) or seq > self._last_seq
+            if reset:
+                seq = 0
+            history = self._rooms.get(room)
+            if history is None:
+                # A room with no buffer lost events only if it was evicted after the client's seq
+                return [], reset or seq < self._floor(room)
+            events = [text for event_seq, text in history.events if event_seq > seq]
+            return events, reset or seq < history.floor
+
+    def page(self, room, before=None, limit=50):
+        """从新到旧分页：返回before之前最近的limit条事件（按时间顺序）和下一页的游标。"""
+        with self._lock:
+            history = self._rooms.get(room)
+            events = list(history.events) if history is not None else []
+            latest = events[-1][0] if events else 0
+        if before is not None:
+            events = [event for event in events if event[0] < before]
+        selected = events[-limit:] if limit > 0 else []
+        next_before = selected[0][0] if selected and len(events) > len(selected) else None
+        return [text for _, text in selected], next_before, latest
+
+    def info(self):
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "events": sum(len(history.events) for history in self._rooms.values()),
+                "last_seq": self._last_seq,
+                "epoch": self.epoch
+            }
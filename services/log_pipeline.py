@@ -0,0 +1,161 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class BatchLogWriter(threading.Thread):
+    """后台写日志线程：请求只把记录放进队列，由本线程批量写盘并按大小/时间轮转。"""
+
+    def __init__(self, path, formatter=str, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 rotate_seconds=None, batch_size=500, flush_interval=0.5):
+        super().__init__(name=f"log-writer:{path}", daemon=True)
+        self.path = path
+        self.formatter = formatter
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_seconds = rotate_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._opened_at = 0.0
+        self._closed = False
+
+    def enqueue(self, record):
+        self._queue.put(record)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        if self._file is not None:
+            self._file.close()
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter(record))
+            except Exception:
+                continue
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(''.join(lines))
+            self._file.flush()
+            if self._should_rotate():
+                self._rotate()
+        except OSError:
+            # Nowhere left to report to; drop the batch rather than kill the writer.
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+            self._file = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self.rotate_seconds:
+            self._opened_at = self._segment_start(os.fstat(self._file.fileno()).st_size)
+
+    def _segment_start(self, size):
+        # The start time is kept beside the log, so a restart does not reset the file's age.
+        # Neither mtime (last write) nor a birth time (missing on Linux) can stand in for it.
+        marker = self.path + '.start'
+        if size:
+            try:
+                with open(marker, 'r', encoding='utf-8') as file:
+                    return float(file.read())
+            except (OSError, ValueError):
+                pass
+        started = time.time()
+        with open(marker, 'w', encoding='utf-8') as file:
+            file.write(repr(started))
+        return started
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+class BatchLogHandler(logging.Handler):
+    """logging处理器：emit只把格式化好的行放进队列，写盘在BatchLogWriter线程里完成。"""
+
+    def __init__(self, writer, level=logging.NOTSET):
+        super().__init__(level)
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            self.writer.enqueue(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+def start_writer(path, **kwargs):
+    writer = BatchLogWriter(path, **kwargs)
+    writer.start()
+    atexit.register(writer.close)
+    return writer
+
+
+def configure_logging(path, level=logging.ERROR, fmt='%(asctime)s:%(levelname)s:%(message)s', **kwargs):
+    root = logging.getLogger()
+    if any(isinstance(handler, BatchLogHandler) for handler in root.handlers):
+        return
+    handler = BatchLogHandler(start_writer(path, **kwargs))
+    handler.setFormatter(logging.Formatter(fmt))
+    root.addHandler(handler)
+    root.setLevel(level)
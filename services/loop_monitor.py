@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from services.metrics import metrics
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    'dice_event_loop_lag_seconds', 'Extra delay of the event loop waking from a timed sleep.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+
+class EventLoopLagMonitor:
+    """定时睡眠并测量实际醒来的延迟，用来观察事件循环是否被阻塞。"""
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.samples = 0
+        self.lag_seconds_total = 0.0
+        self.lag_seconds_max = 0.0
+        self.lag_seconds_last = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.samples += 1
+            self.lag_seconds_total += lag
+            self.lag_seconds_max = max(self.lag_seconds_max, lag)
+            self.lag_seconds_last = lag
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def info(self):
+        return {
+            "samples": self.samples,
+            "lag_seconds_avg": self.lag_seconds_total / self.samples if self.samples else 0.0,
+            "lag_seconds_max": self.lag_seconds_max,
+            "lag_seconds_last": self.lag_seconds_last
+        }
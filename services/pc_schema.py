@@ -0,0 +1,113 @@
+import sys
+
+
+# Core characteristics live at fixed indexes; everything else is a skill.
+CORE_ATTRIBUTES = (
+    'str', 'dex', 'pow', 'con', 'app', 'edu', 'siz', 'int',
+    'san', 'luck', 'mp', 'hp', 'current_san', 'current_mp', 'current_hp',
+)
+CORE_INDEX = {name: index for index, name in enumerate(CORE_ATTRIBUTES)}
+
+# Attributes that also get a current_* value when a sheet is uploaded
+TRACKED_ATTRIBUTES = ('san', 'hp', 'mp')
+
+_ALIAS_GROUPS = {
+    'str': ('力量',),
+    'dex': ('敏捷',),
+    'pow': ('意志',),
+    'con': ('体质',),
+    'app': ('外貌',),
+    'edu': ('教育',),
+    'siz': ('体型',),
+    'int': ('智力', '灵感'),
+    'san': ('san值', '理智', '理智值'),
+    'luck': ('幸运', '运气'),
+    'mp': ('魔法',),
+    'hp': ('体力',),
+    '魅惑': ('取悦',),
+    '计算机使用': ('计算机', '电脑'),
+    '信用评级': ('信用', '信誉'),
+    '克苏鲁神话': ('克苏鲁', 'cm'),
+    '汽车驾驶': ('汽车', '驾驶'),
+    '图书馆使用': ('图书馆',),
+    '锁匠': ('开锁', '撬锁'),
+    '博物学': ('自然学',),
+    '领航': ('导航',),
+    '操作重型机械': ('重型操作', '重型机械', '重型'),
+}
+
+# One shared alias -> canonical table; keys and values are interned so every sheet reuses them.
+ALIASES = {}
+for _canonical, _aliases in _ALIAS_GROUPS.items():
+    for _name in (_canonical,) + _aliases:
+        ALIASES[sys.intern(_name)] = sys.intern(_canonical)
+
+
+def canonical_name(name):
+    name = name.lower()
+    return ALIASES.get(name) or sys.intern(name)
+
+
+class PCSheet:
+    """紧凑的角色卡：核心属性按固定下标存放，技能存入字典，别名在查询时解析。"""
+
+    __slots__ = ('core', 'skills')
+
+    def __init__(self, core=None, skills=None):
+        self.core = core if core is not None else [None] * len(CORE_ATTRIBUTES)
+        self.skills = skills if skills is not None else {}
+
+    @classmethod
+    def from_entries(cls, entries):
+        sheet = cls()
+        aliased = []
+        for name, value in entries:
+            key = canonical_name(name)
+            if key != name.lower():
+                aliased.append((key, value))
+            else:
+                sheet[key] = value
+        # Legacy sheets repeat values under aliases; the canonical line wins.
+        for key, value in aliased:
+            if key not in sheet:
+                sheet[key] = value
+        return sheet
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        key = canonical_name(name)
+        index = CORE_INDEX.get(key)
+        if index is None:
+            self.skills[key] = int(value)
+        else:
+            self.core[index] = int(value)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        return sum(value is not None for value in self.core) + len(self.skills)
+
+    def get(self, name, default=None):
+        key = canonical_name(name)
+        index = CORE_INDEX.get(key)
+        value = self.skills.get(key) if index is None else self.core[index]
+        return default if value is None else value
+
+    def update(self, values):
+        for name, value in values.items():
+            self[name] = value
+
+    def items(self):
+        for name, value in zip(CORE_ATTRIBUTES, self.core):
+            if value is not None:
+                yield name, value
+        yield from self.skills.items()
+
+    def copy(self):
+        return PCSheet(list(self.core), dict(self.skills))
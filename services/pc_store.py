@@ -0,0 +1,570 @@
+import asyncio
+import heapq
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+
+from services.metrics import metrics
+from services.pc_schema import PCSheet, canonical_name
+
+STORAGE_SECONDS = metrics.histogram(
+    'dice_pc_storage_seconds', 'Duration of character sheet storage operations.', ('operation',)
+)
+
+
+def read_stats_file(filename):
+    with open(filename, 'r', encoding='utf-8') as file:
+        return PCSheet.from_entries(line.strip().split('|') for line in file if '|' in line)
+
+
+def write_stats_file(filename, sheet, suffix='.tmp'):
+    tmp_filename = filename + suffix
+    stage_stats_file(tmp_filename, sheet)
+    os.replace(tmp_filename, filename)
+
+
+def stage_stats_file(tmp_filename, sheet):
+    with open(tmp_filename, 'w', encoding='utf-8') as file:
+        file.writelines(f"{name}|{value}\n" for name, value in sheet.items())
+
+
+# Journal line written after a sheet is rewritten: earlier entries for that PC are already in the file
+JOURNAL_RESET = '*'
+
+
+class PCJournal:
+    """HP/SAN等当前值变更的追加日志，每次变更只追加一行，定期合并回角色文件。"""
+
+    def __init__(self, directory='./pcstats', compact_threshold=1000):
+        self.directory = directory
+        self.path = os.path.join(directory, 'journal', 'pc_deltas.log')
+        self.compact_threshold = compact_threshold
+        self.entries = 0
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._fd = None
+        self.replay()
+
+    def sheet_filename(self, pc_number):
+        return f"{self.directory}/pc_file{pc_number}.txt"
+
+    def _open(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def replay(self):
+        pending = {}
+        entries = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    parts = line.rstrip('\n').split('|')
+                    # A torn final line from a crash mid-append is ignored.
+                    if len(parts) != 3:
+                        continue
+                    pc_number, key, value = parts
+                    if key == JOURNAL_RESET:
+                        pending.pop(pc_number, None)
+                        entries += 1
+                        continue
+                    try:
+                        pending.setdefault(pc_number, {})[key] = int(value)
+                    except ValueError:
+                        continue
+                    entries += 1
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.pending = pending
+            self.entries = entries
+
+    def load(self, pc_number):
+        """读取角色卡并叠加尚未合并的当前值；持有日志锁，不会与合并或重写交错。"""
+        key = str(pc_number)
+        with self._lock:
+            sheet = read_stats_file(self.sheet_filename(key))
+            sheet.update(self.pending.get(key, {}))
+        return sheet
+
+    def rewrite(self, pc_numbers, write):
+        """在日志锁内重写这些PC的角色卡。
+
+        write收到{PC: 待合并的当前值}并负责写文件；之后只清掉这些PC的待合并值，其他PC不受影响。
+        """
+        keys = [str(pc_number) for pc_number in pc_numbers]
+        with self._lock:
+            pending = {key: dict(self.pending.get(key, {})) for key in keys}
+            write(pending)
+            folded = [key for key in keys if pending[key]]
+            if folded:
+                os.write(self._open(), ''.join(f"{key}|{JOURNAL_RESET}|0\n" for key in folded).encode('utf-8'))
+                for key in folded:
+                    del self.pending[key]
+                self.entries += len(folded)
+
+    def append(self, pc_number, values):
+        key = str(pc_number)
+        record = ''.join(f"{key}|{name}|{value}\n" for name, value in values.items()).encode('utf-8')
+        with self._lock:
+            # O_APPEND makes the single write land atomically at the end of the file.
+            os.write(self._open(), record)
+            self.pending.setdefault(key, {}).update(values)
+            self.entries += len(values)
+            should_compact = self.entries >= self.compact_threshold
+        try:
+            # Keep the sheet's mtime fresh so the 30-day expiry still sees activity.
+            os.utime(self.sheet_filename(key))
+        except FileNotFoundError:
+            pass
+        if should_compact:
+            self.compact()
+
+    def compact(self):
+        with self._lock:
+            for pc_number, values in self.pending.items():
+                filename = self.sheet_filename(pc_number)
+                if not os.path.exists(filename):
+                    continue
+                sheet = read_stats_file(filename)
+                sheet.update(values)
+                write_stats_file(filename, sheet)
+
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if os.path.exists(self.path):
+                os.truncate(self.path, 0)
+            self.pending = {}
+            self.entries = 0
+
+
+class TextFileBackend:
+    """默认存储：pcstats目录下每个PC一个“名称|数值”文本文件，当前值变更写入PCJournal。"""
+
+    def __init__(self, directory='./pcstats', journal=None):
+        self.directory = directory
+        self.journal = journal if journal is not None else PCJournal(directory)
+
+    def filename(self, pc_number):
+        return f"{self.directory}/pc_file{pc_number}.txt"
+
+    def key(self, pc_number):
+        # Each spelling of a number is its own file
+        return str(pc_number)
+
+    def load(self, pc_number):
+        return self.journal.load(pc_number)
+
+    def save_values(self, pc_number, values):
+        self.journal.append(pc_number, values)
+
+    def _merged_sheet(self, pc_number, entries, replace, pending):
+        # Only this PC's pending HP/SAN changes are folded in; a replaced sheet drops them
+        file_name = self.filename(pc_number)
+        if replace or not os.path.exists(file_name):
+            sheet = PCSheet()
+        else:
+            sheet = read_stats_file(file_name)
+            sheet.update(pending[str(pc_number)])
+        for key, value in entries:
+            sheet[key] = value
+        return sheet
+
+    def upsert_sheet(self, pc_number, entries, replace=False):
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write(pending):
+            # Aliases collapse onto canonical names, so rewritten sheets are stored compactly.
+            write_stats_file(self.filename(pc_number), self._merged_sheet(pc_number, entries, replace, pending))
+
+        self.journal.rewrite([pc_number], write)
+
+    def import_sheets(self, sheets, replace=False):
+        """批量写入多张角色卡：先全部写成临时文件，全部成功后再逐个原子替换。"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        def write(pending):
+            staged = []
+            try:
+                for pc_number, entries in sheets:
+                    file_name = self.filename(pc_number)
+                    stage_stats_file(file_name + '.import', self._merged_sheet(pc_number, entries, replace, pending))
+                    staged.append(file_name)
+            except BaseException:
+                for file_name in staged:
+                    os.remove(file_name + '.import')
+                raise
+
+            for file_name in staged:
+                os.replace(file_name + '.import', file_name)
+
+        self.journal.rewrite([pc_number for pc_number, _ in sheets], write)
+
+    def iter_sheets(self):
+        for pc_number in sorted(self.occupied_ids()):
+            try:
+                yield pc_number, self.load(pc_number)
+            except FileNotFoundError:
+                continue
+
+    def occupied_ids(self):
+        files = os.listdir(self.directory)
+        return [int(f[7:-4]) for f in files if f.startswith('pc_file') and f.endswith('.txt')]
+
+    def last_touched(self):
+        for filename in os.listdir(self.directory):
+            if filename.startswith('pc_file') and filename.endswith('.txt'):
+                file_path = os.path.join(self.directory, filename)
+                yield filename[7:-4], os.path.getmtime(file_path)
+
+    def remove(self, pc_number):
+        try:
+            os.remove(self.filename(pc_number))
+        except FileNotFoundError:
+            pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pcs (
+    pc_id INTEGER PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pc_stats (
+    pc_id INTEGER NOT NULL,
+    stat_name TEXT NOT NULL,
+    stat_value INTEGER NOT NULL,
+    PRIMARY KEY (pc_id, stat_name)
+) WITHOUT ROWID;
+"""
+SELECT_PC = "SELECT 1 FROM pcs WHERE pc_id = ?"
+SELECT_STATS = "SELECT stat_name, stat_value FROM pc_stats WHERE pc_id = ?"
+TOUCH_PC = "INSERT INTO pcs (pc_id, updated_at) VALUES (?, ?) ON CONFLICT (pc_id) DO UPDATE SET updated_at = excluded.updated_at"
+UPSERT_STAT = "INSERT INTO pc_stats (pc_id, stat_name, stat_value) VALUES (?, ?, ?) ON CONFLICT (pc_id, stat_name) DO UPDATE SET stat_value = excluded.stat_value"
+DELETE_STATS = "DELETE FROM pc_stats WHERE pc_id = ?"
+DELETE_PC = "DELETE FROM pcs WHERE pc_id = ?"
+SELECT_IDS = "SELECT pc_id FROM pcs ORDER BY pc_id"
+SELECT_TOUCHED = "SELECT pc_id, updated_at FROM pcs"
+SELECT_STATS_PAGE = (
+    "SELECT pc_id, stat_name, stat_value FROM pc_stats WHERE pc_id IN "
+    "(SELECT DISTINCT pc_id FROM pc_stats WHERE pc_id > ? ORDER BY pc_id LIMIT ?) ORDER BY pc_id"
+)
+
+
+class SQLiteBackend:
+    """可选的SQLite存储（WAL模式），以(pc_id, stat_name)为主键索引，占用ID直接走索引扫描。"""
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            # Connections are shared by the storage threads but only ever used by one at a time.
+            connection = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(connection)
+        with self._connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    @staticmethod
+    def _pc_id(pc_number):
+        try:
+            return int(str(pc_number).strip())
+        except ValueError:
+            raise FileNotFoundError(f"No such PC: {pc_number}")
+
+    def key(self, pc_number):
+        # "01" and "1" are the same row, so they must share a cache entry
+        try:
+            return str(self._pc_id(pc_number))
+        except FileNotFoundError:
+            return str(pc_number)
+
+    def load(self, pc_number):
+        pc_id = self._pc_id(pc_number)
+        with self._connection() as connection:
+            rows = connection.execute(SELECT_STATS, (pc_id,)).fetchall()
+            if not rows and connection.execute(SELECT_PC, (pc_id,)).fetchone() is None:
+                raise FileNotFoundError(f"No such PC: {pc_number}")
+        return PCSheet.from_entries(rows)
+
+    def save_values(self, pc_number, values):
+        pc_id = self._pc_id(pc_number)
+        with self._connection() as connection, connection:
+            connection.executemany(UPSERT_STAT, [(pc_id, canonical_name(name), int(value)) for name, value in values.items()])
+            connection.execute(TOUCH_PC, (pc_id, time.time()))
+
+    def upsert_sheet(self, pc_number, entries, replace=False, updated_at=None):
+        pc_id = self._pc_id(pc_number)
+        rows = [(pc_id, canonical_name(key), int(value)) for key, value in entries]
+        with self._connection() as connection, connection:
+            if replace:
+                connection.execute(DELETE_STATS, (pc_id,))
+            connection.execute(TOUCH_PC, (pc_id, updated_at if updated_at is not None else time.time()))
+            connection.executemany(UPSERT_STAT, rows)
+
+    def import_sheets(self, sheets, replace=False):
+        """批量写入多张角色卡，全部在同一个事务中提交。"""
+        now = time.time()
+        with self._connection() as connection, connection:
+            for pc_number, entries in sheets:
+                pc_id = self._pc_id(pc_number)
+                if replace:
+                    connection.execute(DELETE_STATS, (pc_id,))
+                connection.execute(TOUCH_PC, (pc_id, now))
+                connection.executemany(UPSERT_STAT, [(pc_id, canonical_name(key), int(value)) for key, value in entries])
+
+    def iter_sheets(self, page_size=100):
+        # A connection is held only while one page of PCs is read, so a slow download cannot pin the pool
+        last_id = -1
+        while True:
+            with self._connection() as connection:
+                rows = connection.execute(SELECT_STATS_PAGE, (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            for pc_id, group in groupby(rows, key=itemgetter(0)):
+                yield pc_id, PCSheet.from_entries((name, value) for _, name, value in group)
+            last_id = rows[-1][0]
+
+    def occupied_ids(self):
+        with self._connection() as connection:
+            return [row[0] for row in connection.execute(SELECT_IDS)]
+
+    def last_touched(self):
+        with self._connection() as connection:
+            rows = connection.execute(SELECT_TOUCHED).fetchall()
+        return [(str(pc_id), updated_at) for pc_id, updated_at in rows]
+
+    def remove(self, pc_number):
+        pc_id = self._pc_id(pc_number)
+        with self._connection() as connection, connection:
+            connection.execute(DELETE_STATS, (pc_id,))
+            connection.execute(DELETE_PC, (pc_id,))
+
+    def import_directory(self, directory='./pcstats'):
+        """一次性把pcstats目录中的文本角色卡导入数据库，保留文件的修改时间。"""
+        imported = 0
+        text_backend = TextFileBackend(directory)
+        for filename in os.listdir(directory):
+            if not (filename.startswith('pc_file') and filename.endswith('.txt')):
+                continue
+            pc_number = filename[7:-4]
+            try:
+                stats = text_backend.load(pc_number)
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping {filename}: {str(e)}")
+                continue
+            updated_at = os.path.getmtime(os.path.join(directory, filename))
+            self.upsert_sheet(pc_number, stats.items(), replace=True, updated_at=updated_at)
+            imported += 1
+        return imported
+
+
+def create_backend(url=None, directory='./pcstats'):
+    """根据配置选择角色卡存储：空值为文本文件，sqlite:/path/to.db 为SQLite。"""
+    if not url or url == 'text':
+        return TextFileBackend(directory, PCJournal(directory, compact_threshold=1000))
+    if url.startswith('sqlite:'):
+        return SQLiteBackend(url[len('sqlite:'):])
+    raise ValueError(f"Unsupported PC storage backend: {url}")
+
+
+class PCStatCache:
+    """进程内的PC属性缓存，按LRU淘汰，避免每条指令都重新读取并解析角色卡。"""
+
+    def __init__(self, backend, capacity=1000, lock_stripes=64):
+        self.backend = backend
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # A fixed pool, so PC numbers that do not exist cannot grow it
+        self._pc_locks = [threading.RLock() for _ in range(lock_stripes)]
+
+    def get(self, pc_number):
+        key = self.backend.key(pc_number)
+        with self._lock:
+            stats = self._entries.get(key)
+            if stats is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return stats
+            self.misses += 1
+
+        # Loading under the PC's lock keeps a slow read from caching a sheet that apply()
+        # or invalidate() replaced in the meantime.
+        with self.lock_for(key):
+            with self._lock:
+                stats = self._entries.get(key)
+            if stats is not None:
+                return stats
+            # Raises FileNotFoundError for unknown PCs; callers translate it.
+            started = time.perf_counter()
+            stats = self.backend.load(key)
+            STORAGE_SECONDS.observe(time.perf_counter() - started, 'load')
+            self.put(key, stats)
+            return stats
+
+    def put(self, pc_number, stats):
+        key = self.backend.key(pc_number)
+        with self._lock:
+            self._entries[key] = stats
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def apply(self, pc_number, values):
+        """记录当前值的变更：交给存储后端持久化并更新缓存。"""
+        key = self.backend.key(pc_number)
+        with self.lock_for(key):
+            started = time.perf_counter()
+            self.backend.save_values(key, values)
+            STORAGE_SECONDS.observe(time.perf_counter() - started, 'save')
+            with self._lock:
+                stats = self._entries.get(key)
+                if stats is not None:
+                    updated = stats.copy()
+                    updated.update(values)
+                    self._entries[key] = updated
+
+    def lock_for(self, pc_number):
+        """同一PC的读-改-写（sc/hp）需要串行，避免并发请求互相覆盖。可重入：持锁时仍可调用get/apply。"""
+        return self._pc_locks[hash(self.backend.key(pc_number)) % len(self._pc_locks)]
+
+    def invalidate(self, pc_number):
+        key = self.backend.key(pc_number)
+        # Waits out an in-flight miss so it cannot re-cache the sheet being replaced
+        with self.lock_for(key):
+            with self._lock:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class ExpiryReaper:
+    """按最后修改时间过期删除角色卡：用最小堆记录到期时间，定时任务只处理真正到期的条目。"""
+
+    def __init__(self, backend, max_age_seconds, on_expire=None, interval=600):
+        self.backend = backend
+        self.max_age_seconds = max_age_seconds
+        self.on_expire = on_expire
+        self.interval = interval
+        self.reaped = 0
+        self._heap = []
+        self._deadlines = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def touch(self, pc_number, when=None):
+        key = self.backend.key(pc_number)
+        deadline = (when if when is not None else time.time()) + self.max_age_seconds
+        with self._lock:
+            current = self._deadlines.get(key)
+            if current is not None and current >= deadline:
+                return
+            self._deadlines[key] = deadline
+            # Each PC has at most one heap entry; a later deadline is picked up when that entry surfaces.
+            if current is None:
+                heapq.heappush(self._heap, (deadline, key))
+
+    def seed(self):
+        for pc_number, when in self.backend.last_touched():
+            self.touch(pc_number, when)
+
+    def reap(self, now=None):
+        now = now if now is not None else time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, key))
+                    continue
+                del self._deadlines[key]
+                due.append(key)
+        for key in due:
+            self.backend.remove(key)
+            if self.on_expire is not None:
+                self.on_expire(key)
+            logging.info(f"Deleted expired PC sheet: {key}")
+        self.reaped += len(due)
+        return due
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        await run_blocking(self.seed)
+        while True:
+            try:
+                await run_blocking(self.reap)
+            except Exception as e:
+                logging.error(f"Error reaping expired PC sheets: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def info(self):
+        with self._lock:
+            return {
+                "tracked": len(self._deadlines),
+                "next_expiry": self._heap[0][0] if self._heap else None,
+                "reaped": self.reaped
+            }
+
+
+# Character-sheet file I/O runs here so a slow disk never blocks the event loop.
+storage_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pc-storage')
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, partial(func, *args, **kwargs))
+
+
+if __name__ == '__main__':
+    # python -m services.pc_store ./pcstats ./pcstats/pcstats.db
+    import sys
+    source = sys.argv[1] if len(sys.argv) > 1 else './pcstats'
+    target = sys.argv[2] if len(sys.argv) > 2 else './pcstats/pcstats.db'
+    print(f"Imported {SQLiteBackend(target).import_directory(source)} PC sheets into {target}")
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from services.dice_math import SUCCESS_LEVELS
+from services.pc_store import run_blocking
+
+
+class SkillTally:
+    """单个(房间, PC, 技能)的累计值：次数、出目总和、各成功等级次数和理智损失。"""
+
+    __slots__ = ('rolls', 'roll_sum', 'levels', 'san_loss')
+
+    def __init__(self, rolls=0, roll_sum=0, levels=None, san_loss=0):
+        self.rolls = rolls
+        self.roll_sum = roll_sum
+        self.levels = levels if levels is not None else [0] * len(SUCCESS_LEVELS)
+        self.san_loss = san_loss
+
+    def to_list(self):
+        return [self.rolls, self.roll_sum, self.levels, self.san_loss]
+
+
+class RollStatistics:
+    """按房间、PC和技能增量统计掷骰结果，每条事件O(1)更新，并定期快照到磁盘（path为None时只保存在内存）。"""
+
+    def __init__(self, path, interval=60, max_keys=100000):
+        self.path = path
+        self.interval = interval
+        self.max_keys = max_keys
+        self.dropped = 0
+        self._tallies = {}
+        self._dirty = False
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._task = None
+
+    def record(self, room, pc, skill, roll, rank, san_loss=0):
+        key = (room, str(pc), skill)
+        with self._lock:
+            tally = self._tallies.get(key)
+            if tally is None:
+                if len(self._tallies) >= self.max_keys:
+                    self.dropped += 1
+                    return
+                tally = self._tallies[key] = SkillTally()
+            tally.rolls += 1
+            tally.roll_sum += roll
+            tally.levels[rank] += 1
+            tally.san_loss += san_loss
+            self._dirty = True
+
+    def summary(self, room=None, pc=None):
+        with self._lock:
+            items = [
+                (key, tally.rolls, tally.roll_sum, list(tally.levels), tally.san_loss)
+                for key, tally in self._tallies.items()
+                if (room is None or key[0] == room) and (pc is None or key[1] == str(pc))
+            ]
+        rooms = {}
+        for (room_name, pc_number, skill), rolls, roll_sum, levels, san_loss in sorted(items):
+            player = rooms.setdefault(room_name, {}).setdefault(pc_number, {"rolls": 0, "san_loss": 0, "skills": {}})
+            player["rolls"] += rolls
+            player["san_loss"] += san_loss
+            player["skills"][skill] = {
+                "rolls": rolls,
+                "mean_roll": roll_sum / rolls if rolls else 0.0,
+                "levels": dict(zip(SUCCESS_LEVELS, levels)),
+                "san_loss": san_loss
+            }
+        return rooms
+
+    def snapshot(self):
+        if self.path is None:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = [[*key, *tally.to_list()] for key, tally in self._tallies.items()]
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        return True
+
+    def load(self):
+        self._loaded = True
+        if self.path is None:
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable roll statistics snapshot: {str(e)}")
+            return 0
+        with self._lock:
+            # Merge, since rolls may already have been recorded before the snapshot was read
+            for room, pc, skill, rolls, roll_sum, levels, san_loss in data:
+                tally = self._tallies.setdefault((room, pc, skill), SkillTally())
+                tally.rolls += rolls
+                tally.roll_sum += roll_sum
+                tally.levels = [count + loaded for count, loaded in zip(tally.levels, levels)]
+                tally.san_loss += san_loss
+        return len(data)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Never overwrite a snapshot that was not merged in yet
+        if not self._loaded:
+            await run_blocking(self.load)
+        # Keep whatever the last interval collected
+        await run_blocking(self.snapshot)
+
+    async def _run(self):
+        await run_blocking(self.load)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_blocking(self.snapshot)
+            except Exception as e:
+                logging.error(f"Error writing roll statistics snapshot: {str(e)}")
+
+    def info(self):
+        with self._lock:
+            return {"keys": len(self._tallies), "dropped": self.dropped}
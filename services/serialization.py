@@ -0,0 +1,62 @@
+import json
+
+# orjson (already pinned in requirements.txt) is used when present; msgpack is optional.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _default(obj):
+    # Typed results are NamedTuples; orjson only serializes plain tuples natively.
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, default=_default).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def with_events(fields, texts):
+    # Events are already JSON text, so they are spliced in without re-encoding them.
+    head = dumps(fields)
+    separator = ',' if len(head) > 2 else ''
+    return head[:-1] + separator + '"events":[' + ','.join(texts) + ']}'
+
+
+def binary_supported():
+    return msgpack is not None
+
+
+class Frame:
+    """一次广播事件序列化后的帧，所有接收者共享；MessagePack编码只在首次需要时生成一次。"""
+
+    __slots__ = ('text', '_binary')
+
+    def __init__(self, text):
+        self.text = text
+        self._binary = None
+
+    @classmethod
+    def bundle(cls, texts, **fields):
+        return cls(with_events({"type": "bundle", **fields}, texts))
+
+    @property
+    def binary(self):
+        if self._binary is None:
+            self._binary = msgpack.packb(loads(self.text))
+        return self._binary
@@ -0,0 +1,162 @@
+import codecs
+import csv
+import io
+import re
+
+from services.pc_schema import TRACKED_ATTRIBUTES, canonical_name
+from services.serialization import dumps, loads
+
+MAX_IMPORT_SHEETS = 500
+MAX_IMPORT_BYTES = 10 * 1024 * 1024
+MAX_IMPORT_ERRORS = 50
+MAX_ATTRIBUTE_VALUE = 99999
+ATTRIBUTE_NAME_PATTERN = re.compile(r'^[a-zA-Z_\u4e00-\u9fa5]{1,32}$')
+CSV_HEADER = ('user_id', 'attribute', 'value')
+
+
+async def iter_lines(chunks, max_bytes=MAX_IMPORT_BYTES):
+    """把请求体的字节块增量解码为文本行，不把整个请求体读进内存。"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffered = ''
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise ValueError(f"导入数据不能超过{max_bytes // (1024 * 1024)}MB")
+        buffered += decoder.decode(chunk)
+        *lines, buffered = buffered.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    buffered += decoder.decode(b'', final=True)
+    if buffered:
+        yield buffered.rstrip('\r')
+
+
+class SheetImport:
+    """批量导入时逐条收集并校验角色卡；只有全部通过校验才会交给存储后端一次性写入。"""
+
+    def __init__(self, parse_stats, max_sheets=MAX_IMPORT_SHEETS):
+        # parse_stats turns a ".st ..." string into "name|value" entries
+        self.parse_stats = parse_stats
+        self.max_sheets = max_sheets
+        self.sheets = {}
+        self.errors = []
+
+    def error(self, line_number, message):
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(f"第{line_number}行：{message}")
+
+    def _user_id(self, value):
+        try:
+            user_id = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"用户ID不是整数：{value}")
+        if not (0 <= user_id <= 999):
+            raise ValueError("用户ID取值范围为0-999")
+        return user_id
+
+    def _attribute(self, name, value):
+        if not isinstance(name, str) or not ATTRIBUTE_NAME_PATTERN.match(name):
+            raise ValueError(f"属性名不合法：{name}")
+        if isinstance(value, bool):
+            raise ValueError(f"属性“{name}”的值不是整数")
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"属性“{name}”的值不是整数：{value}")
+        if not (0 <= value <= MAX_ATTRIBUTE_VALUE):
+            raise ValueError(f"属性“{name}”的值超出范围：{value}")
+        return canonical_name(name), value
+
+    def _sheet_for(self, user_id, merge):
+        if user_id in self.sheets and not merge:
+            raise ValueError(f"用户ID重复：{user_id}")
+        if user_id not in self.sheets and len(self.sheets) >= self.max_sheets:
+            raise ValueError(f"一次最多导入{self.max_sheets}张角色卡")
+        return self.sheets.setdefault(user_id, {})
+
+    def add_stats(self, line_number, user_id, stats, merge=False):
+        try:
+            entries = [entry.split('|', 1) for entry in self.parse_stats(stats)]
+            sheet = self._sheet_for(self._user_id(user_id), merge)
+            sheet.update((name, int(value)) for name, value in entries)
+        except ValueError as e:
+            self.error(line_number, str(e))
+
+    def add_attributes(self, line_number, user_id, attributes, merge=False):
+        try:
+            if not isinstance(attributes, dict) or not attributes:
+                raise ValueError("attributes必须是非空对象")
+            values = dict(self._attribute(name, value) for name, value in attributes.items())
+            sheet = self._sheet_for(self._user_id(user_id), merge)
+            sheet.update(values)
+        except ValueError as e:
+            self.error(line_number, str(e))
+
+    def add_ndjson(self, line_number, line):
+        if not line.strip():
+            return
+        try:
+            record = loads(line)
+        except ValueError:
+            self.error(line_number, "不是合法的JSON")
+            return
+        if not isinstance(record, dict):
+            self.error(line_number, "每行应为一个JSON对象")
+        elif isinstance(record.get('stats'), str):
+            self.add_stats(line_number, record.get('user_id'), record['stats'])
+        else:
+            self.add_attributes(line_number, record.get('user_id'), record.get('attributes'))
+
+    def add_csv(self, line_number, line, header):
+        """header为None时本行被当作表头解析并返回；之后每行按表头处理。"""
+        if not line.strip():
+            return header
+        row = next(csv.reader([line]))
+        if header is None:
+            header = tuple(cell.strip().lower() for cell in row)
+            if header[:1] != ('user_id',) or not ({'stats'} <= set(header) or {'attribute', 'value'} <= set(header)):
+                self.error(line_number, "CSV表头应为user_id,attribute,value或user_id,stats")
+                return ()
+            return header
+        if not header:
+            return header
+        record = dict(zip(header, row))
+        if 'stats' in record:
+            self.add_stats(line_number, record.get('user_id'), record['stats'])
+        else:
+            # Long form: one attribute per row, rows for the same PC accumulate
+            self.add_attributes(line_number, record.get('user_id'), {record.get('attribute'): record.get('value')}, merge=True)
+        return header
+
+    def finish(self):
+        """补全current_*当前值，返回(user_id, 条目)列表。"""
+        if not self.sheets and not self.errors:
+            self.errors.append("没有可导入的角色卡")
+        batch = []
+        for user_id, values in self.sheets.items():
+            for name in TRACKED_ATTRIBUTES:
+                if name in values:
+                    values.setdefault(f"current_{name}", values[name])
+            batch.append((user_id, list(values.items())))
+        return batch
+
+
+def export_ndjson(sheets):
+    for pc_number, sheet in sheets:
+        yield dumps({"user_id": pc_number, "attributes": dict(sheet.items())}) + '\n'
+
+
+def export_csv(sheets):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for pc_number, sheet in sheets:
+        for name, value in sheet.items():
+            writer.writerow((pc_number, name, value))
+        # One chunk per PC keeps memory flat however large the store is
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
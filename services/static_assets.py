@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+from services.asset_build import DIST_DIR, ENTRY_PAGE, MANIFEST_NAME
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+# Preferred first when the client weighs encodings equally
+ENCODING_PREFERENCE = ('br', 'gzip')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def accepted_encodings(header):
+    """解析Accept-Encoding，返回{编码: q值}。"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def choose_encoding(header, available):
+    accepted = accepted_encodings(header or '')
+    best, best_quality = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+class StaticAssets(StaticFiles):
+    """在StaticFiles之上按构建清单提供哈希资源：强ETag、长期缓存和预压缩副本的编码协商。
+
+    没有构建产物时行为与StaticFiles相同。
+    """
+
+    def __init__(self, directory='static', **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.files = {}
+        self.load_manifest()
+
+    def load_manifest(self):
+        path = os.path.join(self.directory, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable asset manifest: {str(e)}")
+            return False
+        self.files = manifest.get("files", {})
+        return True
+
+    async def get_response(self, path, scope):
+        entry = self.files.get(path.replace(os.sep, '/'))
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        return self.asset_response(path, entry, Headers(scope=scope))
+
+    def asset_response(self, path, entry, request_headers):
+        encoding = choose_encoding(request_headers.get('accept-encoding'), entry["encodings"])
+        # Each representation gets its own strong validator
+        etag = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+        headers = {
+            "etag": etag,
+            "cache-control": IMMUTABLE_CACHE if entry["immutable"] else REVALIDATE_CACHE,
+            "vary": "Accept-Encoding"
+        }
+        if etag_matches(request_headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        full_path = os.path.join(self.directory, path)
+        if encoding:
+            full_path += ENCODING_SUFFIXES[encoding]
+            headers["content-encoding"] = encoding
+        return FileResponse(full_path, headers=headers, media_type=entry["media_type"])
+
+    def index_response(self, request_headers):
+        """首页：有构建产物时返回改写过引用的版本，否则返回原始index.html。"""
+        path = f"{DIST_DIR}/{ENTRY_PAGE}"
+        entry = self.files.get(path)
+        if entry is None:
+            return FileResponse(os.path.join(self.directory, ENTRY_PAGE))
+        return self.asset_response(path, entry, request_headers)
@@ -8,16 +8,112 @@ document.addEventListener('DOMContentLoaded', function () {
         username = "临时用户";
     }
 
-    const ws = new WebSocket(`ws://${window.location.host}/dice/ws?username=${encodeURIComponent(username)}`);
+    const room = new URLSearchParams(window.location.search).get('room') || 'default';
+
+    let ws;
+    // Highest event seq seen; sent back as ?since= on reconnect so missed rolls are replayed
+    let lastSeq = 0;
+    // Seqs are only comparable within one server epoch (a restart or another worker starts a new one)
+    let historyEpoch = null;
+    let reconnectDelay = 1000;
 
     function setResult(output) {
         const resultDiv = document.getElementById('result');
         resultDiv.innerHTML = output;
     }    
 
-    ws.onmessage = function(event) {
-        const message = JSON.parse(event.data);
+    function renderResult(message) {
         let output = '';
+
+        if (message.error) {
+            return `<p>${message.command}：${message.error}</p>`;
+        }
+
+        if (message.command.toLowerCase() === 'r') {
+            output += `<h3>掷骰指令：${message.result[0]}</h3>`;
+            output += `<p>点数：${message.result[1]}</p>`;
+            if (Array.isArray(message.result[2])) {
+                output += `<p>每次骰点结果：${message.result[2].join(', ')}<p>`;
+            } else {
+                message.result[2].terms.forEach(term => {
+                    output += `<p>${term.dice}：合计${term.sum}，最小${term.min}，最大${term.max}</p>`;
+                });
+            }
+        } else if (message.command.toLowerCase() === 'rm') {
+            output += `<h3>掷骰指令: ${message.result[0]}</h3>`;
+            output += `<p>点数: ${message.result[1]}</p>`;
+            output += `<p>每次骰点结果: ${message.result[2].join(', ')}<p>`;
+        } else if (message.command.toLowerCase() === 'rd') {
+            output += `<h3>属性掷骰：${message.result[0]} - ${message.result[1]}</h3>`;
+            output += `<p>点数：${message.result[2]}，${message.result[3]}<p>`;
+        } else if (message.command.toLowerCase() === 'rh') {
+            output += `<h3>暗骰点数：${message.result}</h3>`;
+        } else if (message.command.toLowerCase() === 'rav' || message.command.toLowerCase() === 'ravs') {
+            if (message.result.length === 11) {
+                output += `<h3>对抗骰点：PC${message.result[0]} vs. PC${message.result[1]}</h3>`;
+                output += `<p>PC${message.result[0]} - ${message.result[2]} - 属性${message.result[4]}/出目${message.result[6]} - ${message.result[8]}</p>`;
+                output += `<p>PC${message.result[1]} - ${message.result[3]} - 属性${message.result[5]}/出目${message.result[7]} - ${message.result[9]}</p>`;
+                output += `<p><strong>PC${message.result[10]}胜利</strong></p>`
+            } else if  (message.result.length === 9) {
+                output += `<h3>对抗骰点：NPC vs. PC${message.result[0]}</h3>`;
+                output += `<p>NPC - 属性${message.result[2]}/出目${message.result[4]} - ${message.result[6]}</p>`;
+                output += `<p>PC${message.result[0]} - ${message.result[1]} - 属性${message.result[3]}/出目${message.result[5]} - ${message.result[7]}</p>`;
+                output += `<p><strong>${message.result[8] === 1 ? "PC" : "NPC"}胜利</strong></p>`
+            } else if (message.result.length === 7) {
+                output += `<h3>对抗骰点：NPC1 vs. NPC2</h3>`;
+                output += `<p>NPC1 - 属性${message.result[0]}/出目${message.result[2]} - ${message.result[4]}</p>`;
+                output += `<p>NPC2 - 属性${message.result[1]}/出目${message.result[3]} - ${message.result[5]}</p>`;
+                output += `<p><strong>${message.result[6]}胜利</strong></p>`
+            }
+        } else if (message.command.toLowerCase() === 'sc') {
+            if (message.result.length === 7) {
+                output += `<h3>San Check ${message.result[0]}/${message.result[1]}</h3>`;
+                output += `<p>灵感 - 属性${message.result[2]}/出目${message.result[4]} - ${message.result[3]}</p>`;
+                output += `<p>San值减少${message.result[5]}点，剩余San:${message.result[6]}`;
+            } else if (message.result.length === 2) {
+                output += `<h3>San值恢复</h3>`;
+                output += `<p>恢复量 - ${message.result[0]}</p>`;
+                output += `<p>当前San - ${message.result[1]}</p>`;
+            }
+        } else if (message.command.toLowerCase() === 'st') {
+            output += `<h3>属性查询</h3>`;
+            output += `<p>属性：${message.result[0]}</p>`;
+            output += `<p>属性值：${message.result[1]}</p>`;
+        } else if (message.command.toLowerCase() === 'hp') {
+            output += `<h3>HP调整</h3>`
+            output += `<p>调整值：${message.result[0]}</p>`;
+            if (message.result[0] !== message.result[1]) {
+                output += `<p>出目：${message.result[1]}</p>`;
+            }
+            output += `<p>当前HP：${message.result[2]}</p>`;
+        }
+
+        return output;
+    }
+
+    function handleMessage(message) {
+        let output = '';
+
+        if (message.type === 'bundle') {
+            if (message.replay) {
+                if (message.epoch !== historyEpoch || message.latest_seq < lastSeq) {
+                    lastSeq = 0;
+                }
+                historyEpoch = message.epoch;
+            }
+            if (message.truncated) {
+                console.warn('Some events were missed while disconnected and are no longer available');
+            }
+            message.events.forEach(handleMessage);
+            return;
+        }
+
+        if (typeof message.seq === 'number') {
+            if (message.seq <= lastSeq) {
+                return;
+            }
+            lastSeq = message.seq;
+        }
     
         if (message.type && (message.type === 'ping' || message.type === 'pong')) {
             console.log('Received', message.type, 'from server');
@@ -25,57 +121,10 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     
         if (message.command && typeof message.command === 'string') {
-            if (message.command.toLowerCase() === 'r') {
-                output += `<h3>掷骰指令：${message.result[0]}</h3>`;
-                output += `<p>点数：${message.result[1]}</p>`;
-                output += `<p>每次骰点结果：${message.result[2].join(', ')}<p>`;
-            } else if (message.command.toLowerCase() === 'rm') {
-                output += `<h3>掷骰指令: ${message.result[0]}</h3>`;
-                output += `<p>点数: ${message.result[1]}</p>`;
-                output += `<p>每次骰点结果: ${message.result[2].join(', ')}<p>`;
-            } else if (message.command.toLowerCase() === 'rd') {
-                output += `<h3>属性掷骰：${message.result[0]} - ${message.result[1]}</h3>`;
-                output += `<p>点数：${message.result[2]}，${message.result[3]}<p>`;
-            } else if (message.command.toLowerCase() === 'rh') {
-                output += `<h3>暗骰点数：${message.result}</h3>`;
-            } else if (message.command.toLowerCase() === 'rav' || message.command.toLowerCase() === 'ravs') {
-                if (message.result.length === 11) {
-                    output += `<h3>对抗骰点：PC${message.result[0]} vs. PC${message.result[1]}</h3>`;
-                    output += `<p>PC${message.result[0]} - ${message.result[2]} - 属性${message.result[4]}/出目${message.result[6]} - ${message.result[8]}</p>`;
-                    output += `<p>PC${message.result[1]} - ${message.result[3]} - 属性${message.result[5]}/出目${message.result[7]} - ${message.result[9]}</p>`;
-                    output += `<p><strong>PC${message.result[10]}胜利</strong></p>`
-                } else if  (message.result.length === 9) {
-                    output += `<h3>对抗骰点：NPC vs. PC${message.result[0]}</h3>`;
-                    output += `<p>NPC - 属性${message.result[2]}/出目${message.result[4]} - ${message.result[6]}</p>`;
-                    output += `<p>PC${message.result[0]} - ${message.result[1]} - 属性${message.result[3]}/出目${message.result[5]} - ${message.result[7]}</p>`;
-                    output += `<p><strong>${message.result[8] === 1 ? "PC" : "NPC"}胜利</strong></p>`
-                } else if (message.result.length === 7) {
-                    output += `<h3>对抗骰点：NPC1 vs. NPC2</h3>`;
-                    output += `<p>NPC1 - 属性${message.result[0]}/出目${message.result[2]} - ${message.result[4]}</p>`;
-                    output += `<p>NPC2 - 属性${message.result[1]}/出目${message.result[3]} - ${message.result[5]}</p>`;
-                    output += `<p><strong>${message.result[6]}胜利</strong></p>`
-                }
-            } else if (message.command.toLowerCase() === 'sc') {
-                if (message.result.length === 7) {
-                    output += `<h3>San Check ${message.result[0]}/${message.result[1]}</h3>`;
-                    output += `<p>灵感 - 属性${message.result[2]}/出目${message.result[4]} - ${message.result[3]}</p>`;
-                    output += `<p>San值减少${message.result[5]}点，剩余San:${message.result[6]}`;
-                } else if (message.result.length === 2) {
-                    output += `<h3>San值恢复</h3>`;
-                    output += `<p>恢复量 - ${message.result[0]}</p>`;
-                    output += `<p>当前San - ${message.result[1]}</p>`;
-                }
-            } else if (message.command.toLowerCase() === 'st') {
-                output += `<h3>属性查询</h3>`;
-                output += `<p>属性：${message.result[0]}</p>`;
-                output += `<p>属性值：${message.result[1]}</p>`;
-            } else if (message.command.toLowerCase() === 'hp') {
-                output += `<h3>HP调整</h3>`
-                output += `<p>调整值：${message.result[0]}</p>`;
-                if (message.result[0] !== message.result[1]) {
-                    output += `<p>出目：${message.result[1]}</p>`;
-                }
-                output += `<p>当前HP：${message.result[2]}</p>`;
+            if (message.command === 'batch') {
+                output += message.results.map(renderResult).join('<hr>');
+            } else {
+                output += renderResult(message);
             }
         
             output += `<p>用户名：${message.username}</p>`;
@@ -88,15 +137,32 @@ document.addEventListener('DOMContentLoaded', function () {
         } else {
             console.error('Invalid message format:', message);
         }
-    };
+    }
 
-    ws.onclose = (event) => {
-        console.error('WebSocket closed:', event);
-    };
+    function connect() {
+        const since = lastSeq > 0 ? `&since=${lastSeq}&epoch=${encodeURIComponent(historyEpoch)}` : '';
+        ws = new WebSocket(`ws://${window.location.host}/dice/ws?username=${encodeURIComponent(username)}&room=${encodeURIComponent(room)}${since}`);
 
-    ws.onerror = (error) => {
-        console.error('WebSocket error:', error);
-    };
+        ws.onopen = () => {
+            reconnectDelay = 1000;
+        };
+
+        ws.onmessage = function(event) {
+            handleMessage(JSON.parse(event.data));
+        };
+
+        ws.onclose = (event) => {
+            console.error('WebSocket closed:', event);
+            setTimeout(connect, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        };
+
+        ws.onerror = (error) => {
+            console.error('WebSocket error:', error);
+        };
+    }
+
+    connect();
 
     setInterval(() => {
         if (ws.readyState === WebSocket.OPEN) {
@@ -120,6 +186,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 command: 'r',
                 a1: commandInput,
                 username: username,
+                room: room,
                 ip: await getIpAddress(),
                 time: new Date().toLocaleTimeString()
             };
@@ -133,6 +200,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 a5: args[4] || "",
                 a6: args[5] || "",
                 username: username,
+                room: room,
                 ip: await getIpAddress(),
                 time: new Date().toLocaleTimeString()
             };